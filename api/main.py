@@ -1,19 +1,23 @@
+import asyncio
+import hashlib
+import json
 import os
 import sys
 import uuid
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from io import BytesIO
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from pathlib import Path
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response
 
 import requests
-import boto3
-from botocore.exceptions import ClientError
 
 # Load .env FIRST
 from dotenv import load_dotenv
@@ -23,16 +27,50 @@ load_dotenv()
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, ROOT_DIR)
 
-from wave import nano_banana_edit, wans2v, generate_qr_code
+from wave import nano_banana_edit, wans2v, generate_qr_code, download_bytes, make_poster
+from mp4 import faststart
+from storage import sweep_orphans
+import preview
+import profiles
+from profiles import Profile
 from quiz import get_random_questions, grade_answers
-
-app = FastAPI(title="UAE National Day Video API", version="1.0.0")
+from cancel import CancelToken, JobCancelled, DeadlineExceeded
+from scheduler import Scheduler, QuotaExceeded, KIOSK, WEB, BACKGROUND
+import metrics
+import tracing
 
 # Config
 AWS_REGION = os.getenv("AWS_REGION", "me-central-1")
 S3_BUCKET = os.getenv("AWS_S3_BUCKET", "")
 S3_PREFIX = os.getenv("AWS_S3_PREFIX", "uae-national-day").strip("/")
 S3_PUBLIC_DOMAIN = os.getenv("AWS_S3_PUBLIC_DOMAIN", "").rstrip("/")
+# Custom S3-compatible endpoint (e.g. loadtest/fake_s3.py); uses path-style addressing
+S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL", "")
+
+# Uploads and job capacity
+MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "10"))
+MAX_UPLOAD_SIZE = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "8"))
+JOB_DEADLINE_SECONDS = int(os.getenv("JOB_DEADLINE_SECONDS", "600"))
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "50"))
+# Scheduling: requests carrying one of these X-API-Key values are on-site kiosks (highest priority)
+KIOSK_API_KEYS = {k.strip() for k in os.getenv("KIOSK_API_KEYS", "").split(",") if k.strip()}
+# Worker slots background (batch) jobs may never take, kept free for kiosk/web arrivals
+RESERVED_INTERACTIVE_SLOTS = int(os.getenv("RESERVED_INTERACTIVE_SLOTS", str(max(1, MAX_CONCURRENT_JOBS // 4))))
+# Active (queued + running) jobs allowed per client, by class; 0 = unlimited
+WEB_MAX_ACTIVE_JOBS = int(os.getenv("WEB_MAX_ACTIVE_JOBS", "0"))
+KIOSK_MAX_ACTIVE_JOBS = int(os.getenv("KIOSK_MAX_ACTIVE_JOBS", "0"))
+BACKGROUND_MAX_ACTIVE_JOBS = int(os.getenv("BACKGROUND_MAX_ACTIVE_JOBS", "0"))
+# Behind a load balancer, key anonymous clients by the address it appends to X-Forwarded-For
+TRUST_X_FORWARDED_FOR = os.getenv("TRUST_X_FORWARDED_FOR", "").lower() in ("1", "true", "yes")
+# Initial guess of one job's slot time, refined by a moving average of real jobs
+SERVICE_TIME_ESTIMATE_SECONDS = float(os.getenv("SERVICE_TIME_ESTIMATE_SECONDS", "120"))
+# Threads rendering instant previews; separate from the worker slots so previews never queue behind generations
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+
+# Completed results remembered for reuse, keyed by (profile version, photo SHA-256); 0 disables reuse
+RESULT_REUSE_SIZE = int(os.getenv("RESULT_REUSE_SIZE", "1000"))
+IMAGE_TYPES = {"image/jpeg", "image/png"}
 
 # NEW: Load credentials from .env
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
@@ -41,46 +79,127 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 if not S3_BUCKET:
     raise RuntimeError("AWS_S3_BUCKET is required")
 
-# UPDATED: AWS client with explicit credentials
-s3 = boto3.client(
-    "s3",
-    region_name=AWS_REGION,
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-)
+# Results are immutable per job id, so phones and CDNs may cache them
+RESULT_CACHE_CONTROL = os.getenv("RESULT_CACHE_CONTROL", "public, max-age=86400, immutable")
+
+# Health probe cadence (seconds); probes are served from the cached result
+HEALTH_REFRESH_SECONDS = float(os.getenv("HEALTH_REFRESH_SECONDS", "30"))
+
+# boto3 is slow to import and build, so the client is created on first use
+_S3_CLIENT = None
+_S3_CLIENT_LOCK = threading.Lock()
 
-# Debug: verify credentials
-try:
-    sts = boto3.client(
-        "sts",
+def _aws_client(service: str):
+    import boto3
+
+    kwargs: Dict[str, Any] = {}
+    if service == "s3" and S3_ENDPOINT_URL:
+        from botocore.config import Config
+
+        kwargs["endpoint_url"] = S3_ENDPOINT_URL
+        kwargs["config"] = Config(s3={"addressing_style": "path"})
+    return boto3.client(
+        service,
         region_name=AWS_REGION,
         aws_access_key_id=AWS_ACCESS_KEY_ID,
         aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        **kwargs,
     )
-    identity = sts.get_caller_identity()
-    print(f"✅ boto3 authenticated as: {identity['Arn']}")
-except Exception as e:
-    print(f"❌ boto3 credential error: {e}")
+
+def _s3():
+    global _S3_CLIENT
+    if _S3_CLIENT is None:
+        with _S3_CLIENT_LOCK:
+            if _S3_CLIENT is None:
+                _S3_CLIENT = _aws_client("s3")
+    return _S3_CLIENT
+
+def _verify_credentials() -> None:
+    # Debug: verify credentials (runs off the event loop after startup)
+    try:
+        identity = _aws_client("sts").get_caller_identity()
+        print(f"✅ boto3 authenticated as: {identity['Arn']}")
+    except Exception as e:
+        print(f"❌ boto3 credential error: {e}")
+
+# Last health probe result, refreshed in the background
+HEALTH: Dict[str, Any] = {"s3_status": "unknown", "checked_at": None}
+
+def _probe_s3() -> None:
+    try:
+        _s3().head_bucket(Bucket=S3_BUCKET)
+        s3_status = "connected"
+    except Exception as e:
+        s3_status = f"error: {e}"
+    HEALTH.update(s3_status=s3_status, checked_at=time.time())
+
+async def _refresh_health() -> None:
+    while True:
+        await asyncio.to_thread(_probe_s3)
+        await asyncio.sleep(HEALTH_REFRESH_SECONDS)
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Serve traffic immediately; credential and bucket checks run in the background.
+    # Uploads older than this start belong to no job (jobs are in-memory) and are swept.
+    tasks = [
+        asyncio.create_task(asyncio.to_thread(_verify_credentials)),
+        asyncio.create_task(_refresh_health()),
+        asyncio.create_task(asyncio.to_thread(sweep_orphans, UPLOAD_DIR, time.time())),
+    ]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+
+app = FastAPI(title="UAE National Day Video API", version="1.0.0", lifespan=lifespan)
 
 def _s3_key(*parts: str) -> str:
     safe = [p.strip("/").replace("..", "") for p in parts if p]
     return "/".join([S3_PREFIX] + safe) if S3_PREFIX else "/".join(safe)
 
-def _s3_put_file(local_path: str, key: str, content_type: str) -> None:
-    s3.upload_file(
-        Filename=local_path,
-        Bucket=S3_BUCKET,
-        Key=key,
-        ExtraArgs={"ContentType": content_type},
-    )
-
-def _s3_put_bytes(data: bytes, key: str, content_type: str) -> None:
-    s3.put_object(Bucket=S3_BUCKET, Key=key, Body=data, ContentType=content_type)
+def _s3_progress(token: Optional[CancelToken]):
+    # boto3 calls this per transferred chunk; raising aborts the transfer.
+    if token is None:
+        return None
+    return lambda _bytes: token.check()
+
+def _s3_put_file(local_path: str, key: str, content_type: str, token: Optional[CancelToken] = None, kind: str = "file") -> None:
+    if token:
+        token.check()
+    with tracing.span("s3_upload", kind=kind, bytes=os.path.getsize(local_path)), metrics.S3_UPLOAD_SECONDS.time(kind=kind):
+        _s3().upload_file(
+            Filename=local_path,
+            Bucket=S3_BUCKET,
+            Key=key,
+            ExtraArgs={"ContentType": content_type},
+            Callback=_s3_progress(token),
+        )
+
+def _s3_put_bytes(
+    data: bytes,
+    key: str,
+    content_type: str,
+    token: Optional[CancelToken] = None,
+    kind: str = "bytes",
+    extra: Optional[Dict[str, str]] = None,
+) -> None:
+    if token:
+        token.check()
+    with tracing.span("s3_upload", kind=kind, bytes=len(data)), metrics.S3_UPLOAD_SECONDS.time(kind=kind):
+        _s3().upload_fileobj(
+            BytesIO(data),
+            S3_BUCKET,
+            key,
+            ExtraArgs={"ContentType": content_type, **(extra or {})},
+            Callback=_s3_progress(token),
+        )
 
 def _s3_url_for_key(key: str, expires: int = 86400) -> str:
     if S3_PUBLIC_DOMAIN:
         return f"{S3_PUBLIC_DOMAIN}/{key}"
-    return s3.generate_presigned_url(
+    return _s3().generate_presigned_url(
         "get_object", Params={"Bucket": S3_BUCKET, "Key": key}, ExpiresIn=expires
     )
 
@@ -99,98 +218,196 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # In-memory jobs
 JOBS: Dict[str, Dict[str, Any]] = {}
+BATCHES: Dict[str, List[str]] = {}
+REUSE: "OrderedDict[tuple, Dict[str, Optional[str]]]" = OrderedDict()
 JOBS_LOCK = threading.Lock()
+SCHEDULER = Scheduler(
+    MAX_CONCURRENT_JOBS,
+    reserved=RESERVED_INTERACTIVE_SLOTS,
+    quotas={KIOSK: KIOSK_MAX_ACTIVE_JOBS, WEB: WEB_MAX_ACTIVE_JOBS, BACKGROUND: BACKGROUND_MAX_ACTIVE_JOBS},
+    service_time_s=SERVICE_TIME_ESTIMATE_SECONDS,
+)
+PREVIEW_POOL = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS, thread_name_prefix="preview")
 
-def _run_pipeline(job_id: str, img_path: str, age_group: str, phone: Optional[str]):
+def _update_job(job_id: str, **fields: Any) -> None:
+    # A cancelled job keeps its terminal state even if its thread is still unwinding.
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+        if job is None or job["status"] == "cancelled":
+            return
+        job.update(fields)
+
+def _discard_upload(img_path: str) -> None:
     try:
-        with JOBS_LOCK:
-            JOBS[job_id] = {
-                "status": "image",
-                "video_url": None,
-                "image_url": None,
-                "error": None,
-                "phone": phone,
-                "started_at": time.time(),
-            }
+        if os.path.exists(img_path):
+            os.remove(img_path)
+    except Exception:
+        pass
+
+def _failure_cause(e: Exception) -> str:
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    if isinstance(e, DeadlineExceeded):
+        return "deadline"
+    if isinstance(e, requests.RequestException):
+        return "network"
+    if isinstance(e, (BotoCoreError, ClientError)):
+        return "s3"
+    if isinstance(e, RuntimeError):
+        return "provider"
+    return type(e).__name__
+
+def _remember_result(reuse_key: tuple, keys: Dict[str, Optional[str]]) -> None:
+    if RESULT_REUSE_SIZE <= 0:
+        return
+    with JOBS_LOCK:
+        REUSE[reuse_key] = keys
+        REUSE.move_to_end(reuse_key)
+        while len(REUSE) > RESULT_REUSE_SIZE:
+            REUSE.popitem(last=False)
+
+def _reused_record(reuse_key: tuple, profile: Profile, phone: Optional[str]) -> Optional[Dict[str, Any]]:
+    """A completed job record built from an earlier result for the same profile version and photo."""
+    if RESULT_REUSE_SIZE <= 0:
+        return None
+    with JOBS_LOCK:
+        keys = REUSE.get(reuse_key)
+        if keys is None:
+            return None
+        REUSE.move_to_end(reuse_key)
+    now = time.time()
+    return {
+        "status": "completed",
+        "class": None,
+        "profile": profile.name,
+        "profile_version": profile.version,
+        "video_url": _s3_url_for_key(keys["video_key"]),
+        "image_url": _s3_url_for_key(keys["image_key"]),
+        "poster_url": _s3_url_for_key(keys["poster_key"]) if keys.get("poster_key") else None,
+        "error": None,
+        "phone": phone,
+        "reused": True,
+        "queued_at": now,
+        "completed_at": now,
+    }
+
+def _run_pipeline(job_id: str, img_path: str, profile: Profile, phone: Optional[str], token: CancelToken, reuse_key: tuple):
+    stage = None
+
+    def enter(name: Optional[str]) -> None:
+        # Keep the in-flight gauge in step with the stage this job is in
+        nonlocal stage
+        if stage:
+            metrics.JOBS_IN_FLIGHT.dec(stage=stage)
+        if name:
+            metrics.JOBS_IN_FLIGHT.inc(stage=name)
+            stage = name
+
+    trace = tracing.bind(job_id)
+    try:
+        started_at = time.time()
+        if trace:
+            trace.record("queue", trace.created_at, started_at)
+        token.check()
+        _update_job(job_id, status="image", started_at=started_at)
 
         # Upload original (optional audit)
+        enter("upload_original")
         ext = Path(img_path).suffix.lower() or ".jpg"
         upload_key = _s3_key("uploads", f"{job_id}{ext}")
-        _s3_put_file(img_path, upload_key, "image/jpeg" if ext in [".jpg", ".jpeg"] else "image/png")
+        _s3_put_file(img_path, upload_key, "image/jpeg" if ext in [".jpg", ".jpeg"] else "image/png", token=token, kind="upload")
 
         # Image edit
-        edited_img_url = nano_banana_edit(img1=img_path, age_gap=age_group)
+        enter("image")
+        with tracing.span("image_edit"):
+            edited_img_url = nano_banana_edit(img1=img_path, age_gap=profile, token=token)
         if not edited_img_url:
             raise RuntimeError("Image generation failed")
 
-        with JOBS_LOCK:
-            JOBS[job_id]["status"] = "video"
+        _update_job(job_id, status="video")
 
         # Video generation
-        video_url_remote = wans2v(img=edited_img_url, age_gap=age_group)
+        enter("video")
+        with tracing.span("video"):
+            video_url_remote = wans2v(img=edited_img_url, age_gap=profile, token=token)
         if not video_url_remote:
             raise RuntimeError("Video generation failed")
 
         # Upload edited image to S3
-        img_resp = requests.get(edited_img_url, timeout=60)
-        img_resp.raise_for_status()
-        img_bytes = img_resp.content
+        enter("publish")
+        img_bytes, img_type = download_bytes(edited_img_url, token=token, timeout=60, kind="image")
         image_key = _s3_key("images", f"{job_id}.jpeg")
-        _s3_put_bytes(img_bytes, image_key, img_resp.headers.get("Content-Type", "image/jpeg"))
+        _s3_put_bytes(img_bytes, image_key, img_type or "image/jpeg", token=token, kind="image")
 
-        # Upload final video to S3
-        vid_resp = requests.get(video_url_remote, timeout=300)
-        vid_resp.raise_for_status()
-        vid_bytes = vid_resp.content
+        # Poster for the result page (best effort; the video is what matters)
+        poster_key = None
+        try:
+            poster_key = _s3_key("posters", f"{job_id}.jpg")
+            _s3_put_bytes(
+                make_poster(img_bytes), poster_key, "image/jpeg", token=token, kind="poster",
+                extra={"CacheControl": RESULT_CACHE_CONTROL},
+            )
+        except JobCancelled:
+            raise
+        except Exception as e:
+            print(f"Poster for {job_id} failed: {e}")
+            poster_key = None
+
+        # Upload final video to S3, moov first so playback starts before the download finishes
+        vid_bytes, _ = download_bytes(video_url_remote, token=token, timeout=300, kind="video")
+        with tracing.span("faststart", bytes=len(vid_bytes)) as sp:
+            fast_bytes = faststart(vid_bytes)
+            sp.set(rewritten=fast_bytes is not vid_bytes)
         video_key = _s3_key("videos", f"{job_id}.mp4")
-        _s3_put_bytes(vid_bytes, video_key, "video/mp4")
+        _s3_put_bytes(
+            fast_bytes, video_key, "video/mp4", token=token, kind="video",
+            extra={
+                "CacheControl": RESULT_CACHE_CONTROL,
+                "ContentDisposition": f'inline; filename="uae-national-day-{job_id[:8]}.mp4"',
+            },
+        )
 
         # URLs
         s3_image_url = _s3_url_for_key(image_key)
         s3_video_url = _s3_url_for_key(video_key)
 
-        with JOBS_LOCK:
-            JOBS[job_id]["status"] = "completed"
-            JOBS[job_id]["image_url"] = s3_image_url
-            JOBS[job_id]["video_url"] = s3_video_url
-            JOBS[job_id]["completed_at"] = time.time()
-
+        _update_job(
+            job_id,
+            status="completed",
+            image_url=s3_image_url,
+            video_url=s3_video_url,
+            poster_url=_s3_url_for_key(poster_key) if poster_key else None,
+            completed_at=time.time(),
+        )
+        _remember_result(reuse_key, {"image_key": image_key, "video_key": video_key, "poster_key": poster_key})
+        metrics.JOBS_TOTAL.inc(status="completed")
+        tracing.finish(job_id, "completed")
+
+    except JobCancelled as e:
+        if isinstance(e, DeadlineExceeded):
+            _update_job(job_id, status="failed", error=f"{type(e).__name__}: {e}", failed_at=time.time())
+            metrics.JOBS_TOTAL.inc(status="failed")
+            metrics.FAILURES_TOTAL.inc(stage=stage or "queued", cause="deadline")
+            tracing.finish(job_id, "failed")
+        else:
+            # Status and metrics were recorded by the DELETE handler; close the
+            # trace here, once this thread has stopped adding spans to it
+            tracing.finish(job_id, "cancelled")
     except Exception as e:
-        with JOBS_LOCK:
-            JOBS[job_id] = {
-                "status": "failed",
-                "video_url": None,
-                "image_url": None,
-                "error": f"{type(e).__name__}: {e}",
-                "phone": phone,
-                "failed_at": time.time(),
-            }
+        _update_job(job_id, status="failed", error=f"{type(e).__name__}: {e}", failed_at=time.time())
+        metrics.JOBS_TOTAL.inc(status="failed")
+        metrics.FAILURES_TOTAL.inc(stage=stage or "queued", cause=_failure_cause(e))
+        tracing.finish(job_id, "failed")
     finally:
+        enter(None)
         # Clean temp
-        try:
-            if os.path.exists(img_path):
-                os.remove(img_path)
-        except Exception:
-            pass
+        _discard_upload(img_path)
 
-@app.post("/api/jobs")
-async def create_job(
-    image: UploadFile = File(..., description="JPEG/PNG, max size enforced"),
-    age_group: str = Form(...),
-    phone: Optional[str] = Form(None),
-):
-    if age_group not in {"Male", "Female", "Boy", "Girl"}:
-        raise HTTPException(400, detail="Invalid age_group")
-    if image.content_type not in {"image/jpeg", "image/png"}:
-        raise HTTPException(400, detail="Only JPEG/PNG images are accepted")
-
-    job_id = str(uuid.uuid4())
-    ext = Path(image.filename).suffix or ".jpg"
-    upload_path = os.path.join(UPLOAD_DIR, f"{job_id}{ext}")
-
-    # Stream to disk with size cap
+async def _save_upload(image: UploadFile, upload_path: str) -> str:
+    """Stream to disk with size cap; returns the SHA-256 of the photo."""
     read = 0
     chunk_size = 1024 * 1024
+    digest = hashlib.sha256()
     try:
         with open(upload_path, "wb") as f:
             while True:
@@ -200,36 +417,323 @@ async def create_job(
                 read += len(chunk)
                 if read > MAX_UPLOAD_SIZE:
                     raise HTTPException(413, detail=f"File too large (max {MAX_UPLOAD_SIZE_MB}MB)")
+                digest.update(chunk)
                 f.write(chunk)
+        return digest.hexdigest()
+    except BaseException:
+        # Size cap, disk errors or a dropped client: never leave a partial file behind
+        _discard_upload(upload_path)
+        raise
     finally:
         await image.close()
 
-    # Start background processing
-    t = threading.Thread(target=_run_pipeline, args=(job_id, upload_path, age_group, phone), daemon=True)
-    t.start()
+def _client_ip(request: Request) -> str:
+    if TRUST_X_FORWARDED_FOR:
+        # The rightmost entry was added by our own load balancer; anything left of it is client-supplied
+        forwarded = request.headers.get("x-forwarded-for", "").split(",")[-1].strip()
+        if forwarded:
+            return forwarded
+    return request.client.host if request.client else "unknown"
+
+def _client_identity(request: Request, api_key: Optional[str], phone: Optional[str]):
+    """Scheduling class and quota key: API key if given, else phone, else client address."""
+    if api_key:
+        cls = KIOSK if api_key in KIOSK_API_KEYS else WEB
+        return cls, "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    if phone:
+        return WEB, f"phone:{phone}"
+    return WEB, f"ip:{_client_ip(request)}"
+
+def _profile_for(age_group: Any) -> Optional[Profile]:
+    try:
+        registry = profiles.get_registry()
+    except (OSError, ValueError) as e:
+        print(f"❌ Profiles unavailable: {e}")
+        raise HTTPException(503, detail="Category profiles unavailable")
+    return registry.get(age_group) if isinstance(age_group, str) else None
+
+def _finish_reused(job_ids: List[str], reuse_keys: List[tuple]) -> None:
+    """Give reused jobs a (one-span) trace like any other job, so their timeline resolves."""
+    for job_id, (version, image_sha) in zip(job_ids, reuse_keys):
+        trace = tracing.begin(job_id)
+        trace.record("reuse", trace.created_at, time.time(), profile_version=version, image_sha256=image_sha[:16])
+        tracing.finish(job_id, "reused")
+
+def _prepare_job(
+    job_id: str, upload_path: str, profile: Profile, phone: Optional[str], deadline: int, cls: str, reuse_key: tuple
+):
+    """Build the job record and the scheduler entry for one uploaded image."""
+    token = CancelToken(deadline_s=deadline)
+    record = {
+        "status": "queued",
+        "class": cls,
+        "profile": profile.name,
+        "profile_version": profile.version,
+        "video_url": None,
+        "image_url": None,
+        "error": None,
+        "phone": phone,
+        "upload_path": upload_path,
+        "queued_at": time.time(),
+    }
+    fn = lambda: _run_pipeline(job_id, upload_path, profile, phone, token, reuse_key)
+    return record, (job_id, fn, token)
 
-    return {"job_id": job_id, "status": "queued"}
+def _render_preview(job_id: str, upload_path: str) -> None:
+    tracing.bind(job_id)
+    try:
+        preview.put(job_id, preview.make_preview(upload_path))
+    except Exception as e:
+        # Best effort: the upload may already be gone if the job was cancelled
+        print(f"Preview for {job_id} failed: {e}")
 
-@app.get("/api/jobs/{job_id}")
-async def job_status(job_id: str):
+def _job_deadline(deadline_seconds: Optional[int]) -> int:
+    # Clients may ask for a shorter deadline, never a longer one
+    if deadline_seconds and deadline_seconds > 0:
+        return min(deadline_seconds, JOB_DEADLINE_SECONDS)
+    return JOB_DEADLINE_SECONDS
+
+def _enqueue(job_ids: List[str], paths: List[str], entries, cls: str, client: str, batch_id: Optional[str] = None) -> None:
+    """Hand jobs (already in JOBS) to the scheduler; undo them if the client went over quota meanwhile."""
+    try:
+        SCHEDULER.submit_many(entries, cls=cls, client=client)
+    except QuotaExceeded as e:
+        with JOBS_LOCK:
+            for job_id in job_ids:
+                JOBS.pop(job_id, None)
+            if batch_id:
+                BATCHES.pop(batch_id, None)
+        for job_id in job_ids:
+            tracing.discard(job_id)
+        for upload_path in paths:
+            _discard_upload(upload_path)
+        raise HTTPException(429, detail=str(e))
+
+@app.post("/api/jobs")
+async def create_job(
+    request: Request,
+    image: UploadFile = File(..., description="JPEG/PNG, max size enforced"),
+    age_group: str = Form(...),
+    phone: Optional[str] = Form(None),
+    deadline_seconds: Optional[int] = Form(None),
+    x_api_key: Optional[str] = Header(None),
+):
+    profile = _profile_for(age_group)
+    if profile is None:
+        raise HTTPException(400, detail="Invalid age_group")
+    if image.content_type not in IMAGE_TYPES:
+        raise HTTPException(400, detail="Only JPEG/PNG images are accepted")
+
+    # Reject over-quota clients before accepting the upload
+    cls, client = _client_identity(request, x_api_key, phone)
+    try:
+        SCHEDULER.check_quota(cls, client)
+    except QuotaExceeded as e:
+        raise HTTPException(429, detail=str(e))
+
+    job_id = str(uuid.uuid4())
+    ext = Path(image.filename).suffix or ".jpg"
+    upload_path = os.path.join(UPLOAD_DIR, f"{job_id}{ext}")
+    image_sha = await _save_upload(image, upload_path)
+
+    # Same photo and same profile version as an earlier job: hand back that result
+    reuse_key = (profile.version, image_sha)
+    reused = _reused_record(reuse_key, profile, phone)
+    if reused:
+        _discard_upload(upload_path)
+        with JOBS_LOCK:
+            JOBS[job_id] = reused
+        metrics.JOBS_TOTAL.inc(status="reused")
+        await asyncio.to_thread(_finish_reused, [job_id], [reuse_key])
+        return {"job_id": job_id, "status": "completed", "class": None}
+
+    record, entry = _prepare_job(job_id, upload_path, profile, phone, _job_deadline(deadline_seconds), cls, reuse_key)
     with JOBS_LOCK:
-        job = JOBS.get(job_id)
+        JOBS[job_id] = record
 
-    if not job:
-        return JSONResponse({"status": "queued"})
+    tracing.begin(job_id)
 
-    resp = {"status": job["status"], "error": job.get("error")}
-    if job["status"] == "completed":
+    # Queue for a worker slot; the pipeline runs in its own thread once one frees up
+    _enqueue([job_id], [upload_path], [entry], cls, client)
+    PREVIEW_POOL.submit(_render_preview, job_id, upload_path)
+
+    return {"job_id": job_id, "status": "queued", "class": cls}
+
+@app.post("/api/jobs/batch")
+async def create_batch(
+    request: Request,
+    images: List[UploadFile] = File(..., description="JPEG/PNG files, one per item"),
+    items: str = Form(..., description='JSON list aligned with images, e.g. [{"age_group": "Male", "phone": "050..."}]'),
+    deadline_seconds: Optional[int] = Form(None),
+    x_api_key: Optional[str] = Header(None),
+):
+    try:
+        specs = json.loads(items)
+    except ValueError:
+        raise HTTPException(400, detail="items must be a JSON list")
+    if not isinstance(specs, list) or len(specs) != len(images):
+        raise HTTPException(400, detail="items must be a JSON list with one entry per image")
+    if len(images) > MAX_BATCH_SIZE:
+        raise HTTPException(413, detail=f"Batch too large (max {MAX_BATCH_SIZE} images)")
+    item_profiles = []
+    for i, (spec, image) in enumerate(zip(specs, images)):
+        profile = _profile_for(spec.get("age_group")) if isinstance(spec, dict) else None
+        if profile is None:
+            raise HTTPException(400, detail=f"Invalid age_group for item {i}")
+        item_profiles.append(profile)
+        if image.content_type not in IMAGE_TYPES:
+            raise HTTPException(400, detail=f"Only JPEG/PNG images are accepted (item {i})")
+
+    # Batches from a kiosk station are guests at the event and queue as kiosk
+    # jobs; anything else is bulk work for the capacity interactive guests leave idle
+    cls, client = _client_identity(request, x_api_key, None)
+    if cls != KIOSK:
+        cls = BACKGROUND
+    try:
+        SCHEDULER.check_quota(cls, client, len(images))
+    except QuotaExceeded as e:
+        raise HTTPException(429, detail=str(e))
+
+    # Validate everything before writing anything, then stream each file to disk
+    job_ids = [str(uuid.uuid4()) for _ in images]
+    paths = [
+        os.path.join(UPLOAD_DIR, f"{job_id}{Path(image.filename).suffix or '.jpg'}")
+        for job_id, image in zip(job_ids, images)
+    ]
+    saved = False
+    try:
+        shas = [await _save_upload(image, upload_path) for image, upload_path in zip(images, paths)]
+        saved = True
+    finally:
+        # Any failure (size cap, disk full, client gone) drops the files already written
+        if not saved:
+            for upload_path in paths:
+                _discard_upload(upload_path)
+
+    deadline = _job_deadline(deadline_seconds)
+    records, entries, queued, reused_keys = {}, [], [], {}
+    for job_id, upload_path, spec, profile, image_sha in zip(job_ids, paths, specs, item_profiles, shas):
+        reuse_key = (profile.version, image_sha)
+        reused = _reused_record(reuse_key, profile, spec.get("phone"))
+        if reused:
+            _discard_upload(upload_path)
+            records[job_id] = reused
+            reused_keys[job_id] = reuse_key
+            metrics.JOBS_TOTAL.inc(status="reused")
+            continue
+        record, entry = _prepare_job(job_id, upload_path, profile, spec.get("phone"), deadline, cls, reuse_key)
+        records[job_id] = record
+        entries.append(entry)
+        queued.append((job_id, upload_path))
+
+    batch_id = str(uuid.uuid4())
+    with JOBS_LOCK:
+        JOBS.update(records)
+        BATCHES[batch_id] = job_ids
+    for job_id, _ in queued:
+        tracing.begin(job_id)
+
+    # One scheduler operation for the whole batch
+    if entries:
+        _enqueue(job_ids, [path for _, path in queued], entries, cls, client, batch_id=batch_id)
+    for job_id, upload_path in queued:
+        PREVIEW_POOL.submit(_render_preview, job_id, upload_path)
+    if reused_keys:
+        await asyncio.to_thread(_finish_reused, list(reused_keys), list(reused_keys.values()))
+
+    # A batch made entirely of reused results is already done
+    status = "queued" if queued else "completed"
+    return {"batch_id": batch_id, "job_ids": job_ids, "status": status, "class": cls}
+
+@app.get("/api/jobs/batch/{batch_id}")
+async def batch_status(batch_id: str):
+    with JOBS_LOCK:
+        job_ids = BATCHES.get(batch_id)
+        if job_ids is None:
+            raise HTTPException(404, detail="Batch not found")
+        jobs = [(job_id, dict(JOBS[job_id])) for job_id in job_ids]
+
+    counts: Dict[str, int] = {}
+    views = []
+    for job_id, job in jobs:
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+        views.append({"job_id": job_id, **_job_view(job_id, job)})
+    return {"batch_id": batch_id, "counts": counts, "jobs": views}
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+        if not job:
+            raise HTTPException(404, detail="Job not found")
+        if job["status"] in {"completed", "failed", "cancelled"}:
+            raise HTTPException(409, detail=f"Job already {job['status']}")
+        job.update(status="cancelled", error="Cancelled by client", cancelled_at=time.time())
+        upload_path = job.get("upload_path")
+    metrics.JOBS_TOTAL.inc(status="cancelled")
+
+    # Frees the worker slot now; a running pipeline stops at its next checkpoint
+    # and finishes the trace itself. A pending job never runs, so finish it here.
+    if SCHEDULER.cancel(job_id, reason="cancelled by client") == "pending":
+        if upload_path:
+            _discard_upload(upload_path)
+        await asyncio.to_thread(tracing.finish, job_id, "cancelled")
+
+    return {"job_id": job_id, "status": "cancelled"}
+
+def _job_view(job_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
+    resp = {"status": job["status"], "error": job.get("error"), "class": job.get("class")}
+    if job.get("profile"):
+        resp["profile"] = job["profile"]
+        resp["profile_version"] = job.get("profile_version")
+    if preview.get(job_id) is not None:
+        resp["preview_url"] = f"/api/jobs/{job_id}/preview"
+    if job["status"] == "queued":
+        resp["progress"] = "Waiting for a free worker..."
+        est = SCHEDULER.estimate(job_id)
+        if est:
+            resp["queue_position"] = est["position"]
+            resp["estimated_wait_s"] = est["estimated_wait_s"]
+    elif job["status"] == "completed":
         resp["video_url"] = job.get("video_url")
         resp["image_url"] = job.get("image_url")
+        resp["poster_url"] = job.get("poster_url")
         resp["qr_url"] = f"/api/jobs/{job_id}/qr"
+        if job.get("reused"):
+            resp["reused"] = True
     elif job["status"] == "image":
         resp["progress"] = "Editing image..."
     elif job["status"] == "video":
         resp["progress"] = "Generating video..."
-
     return resp
 
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    if job_id == "batch":
+        # Reserved for /api/jobs/batch/{batch_id}; never a job id
+        raise HTTPException(404, detail="Batch id required")
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+
+    if not job:
+        return JSONResponse({"status": "queued"})
+
+    return _job_view(job_id, job)
+
+@app.get("/api/jobs/{job_id}/preview")
+async def job_preview(job_id: str):
+    data = preview.get(job_id)
+    if data is None:
+        raise HTTPException(404, detail="Preview not available")
+    return Response(content=data, media_type="image/jpeg", headers={"Cache-Control": "private, max-age=3600"})
+
+@app.get("/api/jobs/{job_id}/timeline")
+async def job_timeline(job_id: str):
+    trace = tracing.get(job_id)
+    if not trace:
+        raise HTTPException(404, detail="Timeline not available")
+    return trace.to_dict()
+
 @app.get("/api/jobs/{job_id}/qr")
 async def job_qr(job_id: str):
     with JOBS_LOCK:
@@ -262,23 +766,37 @@ async def submit_answers(job_id: str, payload: Dict[str, Any]):
         raise HTTPException(400, detail="Invalid payload")
     return grade_answers(key, answers)
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/healthz")
 async def healthz():
-    try:
-        s3.head_bucket(Bucket=S3_BUCKET)
-        s3_status = "connected"
-    except Exception as e:
-        s3_status = f"error: {e}"
+    with JOBS_LOCK:
+        jobs_active = len([j for j in JOBS.values() if j["status"] in {"image", "video"}])
     return {
         "ok": True,
         "s3_bucket": S3_BUCKET,
         "s3_region": AWS_REGION,
-        "s3_status": s3_status,
-        "jobs_active": len([j for j in JOBS.values() if j["status"] in {"image", "video"}]),
+        "s3_status": HEALTH["s3_status"],
+        "s3_checked_at": HEALTH["checked_at"],
+        "jobs_active": jobs_active,
+        "scheduler": SCHEDULER.stats(),
         "prefix": S3_PREFIX,
         "cdn": S3_PUBLIC_DOMAIN or "presigned",
     }
 
+@app.get("/livez")
+async def livez():
+    # Process is up and the event loop is responsive
+    return {"ok": True}
+
+@app.get("/readyz")
+async def readyz():
+    ready = HEALTH["s3_status"] == "connected"
+    body = {"ok": ready, "s3_status": HEALTH["s3_status"], "s3_checked_at": HEALTH["checked_at"]}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -6,8 +6,12 @@ import json
 from typing import List, Dict, Any
 
 # CHANGED: Import nano_banana_edit instead of qwen_edit
-from wave import nano_banana_edit, save_video, wans2v, save_photo, generate_qr_code
+from wave import nano_banana_edit, save_video, wans2v, save_photo, save_poster, generate_qr_code
 from quiz import get_random_questions, grade_answers
+import result_server
+from storage import STORE
+from preview import render_preview
+from profiles import get_registry
 
 
 
@@ -37,7 +41,9 @@ def _run_pipeline(img: str, age_gap: str, phone: str):
             raise RuntimeError("Video generation failed")
 
         # Save locally
-        save_photo(url=edited_img, id=phone)
+        photo_path = save_photo(url=edited_img, id=phone)
+        if photo_path:
+            save_poster(photo_path, id=phone)
         saved_path = save_video(url=video_url, id=phone)
         if not saved_path:
             raise RuntimeError("Saving video failed")
@@ -58,6 +64,13 @@ def start_job(img: str, age_gap: str, phone: str):
     t = threading.Thread(target=_run_pipeline, args=(img, age_gap, phone), daemon=True)
     t.start()
 
+    # Instant local preview while the real generation runs
+    try:
+        preview_img = render_preview(img)
+    except Exception as e:
+        print(f"Preview failed: {e}")
+        preview_img = None
+
     # Prepare 10 random questions (from pool of 50)
     questions = get_random_questions(count=10, seed=phone)
 
@@ -69,7 +82,7 @@ def start_job(img: str, age_gap: str, phone: str):
     # Visible quiz group
     quiz_visible = gr.update(visible=True)
     info_text = f"Job started for {phone}. Please answer the quiz while we generate your video."
-    return phone, questions, quiz_visible, info_text, *radio_updates
+    return phone, questions, quiz_visible, info_text, preview_img, *radio_updates
 
 
 def check_status(phone: str):
@@ -117,8 +130,8 @@ def submit_answers(phone: str, questions: List[Dict[str, Any]], answers: List[An
 
     result = grade_answers(questions, chosen)
 
-    # Persist minimal result to local file for privacy-respecting recordkeeping
-    os.makedirs("result/quiz", exist_ok=True)
+    # Persist minimal result for privacy-respecting recordkeeping; the store
+    # hashes the phone number, so it never becomes part of a path
     rec = {
         "phone": phone,
         "timestamp": int(time.time()),
@@ -126,8 +139,7 @@ def submit_answers(phone: str, questions: List[Dict[str, Any]], answers: List[An
         "correct": result["correct"],
         "total": result["total"],
     }
-    with open(os.path.join("result/quiz", f"{phone}.json"), "w", encoding="utf-8") as f:
-        json.dump(rec, f, ensure_ascii=False, indent=2)
+    STORE.write("quiz", phone, ".json", json.dumps(rec, ensure_ascii=False, indent=2).encode("utf-8"))
 
     summary = f"You scored {result['correct']} / {result['total']} (Score: {result['score']})."
     return gr.update(value=summary)
@@ -142,7 +154,7 @@ with gr.Blocks() as app:
     with gr.Row():
         with gr.Column():
             agegroup = gr.Dropdown(
-                choices=["Male", "Female", "Boy", "Girl"],
+                choices=get_registry().names(),
                 label="Category",
                 value="Boy"
             )
@@ -165,15 +177,16 @@ with gr.Blocks() as app:
                 result_md = gr.Markdown("", label="Result")
 
         with gr.Column():
+            preview_output = gr.Image(label="Preview", type="pil")
             output_video = gr.Video(label="Result")
             qr_code_output = gr.Image(label="📱 Scan to Download Video", type="pil")
             progress_md = gr.Markdown("")
 
-    # Start job: returns phone_state, questions_state, show quiz, info, radios
+    # Start job: returns phone_state, questions_state, show quiz, info, preview, radios
     generate_btn.click(
         fn=start_job,
         inputs=[input_img, agegroup, phone],
-        outputs=[phone_state, questions_state, quiz_group, status_text, *radios],
+        outputs=[phone_state, questions_state, quiz_group, status_text, preview_output, *radios],
     )
 
     # Periodically check job status and update video/QR
@@ -195,6 +208,9 @@ with gr.Blocks() as app:
 
 if __name__ == "__main__":
     cwd = os.path.dirname(os.path.abspath(__file__))
+    # Drop partial writes from a previous crash, then serve saved results to phones that scan the QR code
+    STORE.sweep()
+    result_server.start()
     app.launch(
         server_name="0.0.0.0",
         debug=True,
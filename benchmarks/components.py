@@ -0,0 +1,207 @@
+"""
+Micro-benchmarks for the in-process hot paths of one job.
+
+Measures wall time, peak traced memory and net allocated blocks for image
+compression, base64 encoding, QR generation, quiz helpers and the Nano Banana
+request body build. Results can be saved as a named baseline and compared later:
+
+    python benchmarks/components.py --save main
+    python benchmarks/components.py --compare main
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT_DIR)
+
+from data_info import bg_path, img3_m, img3_f, img3_b, img3_g, audio_m, audio_f, audio_b, audio_g
+from wave import compress_image, file_to_base64, asset_to_base64, generate_qr_code, _nano_banana_payload
+from quiz import get_random_questions, grade_answers
+from profiles import get_registry
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+# Typical phone camera outputs (width, height)
+PHOTO_SIZES = {
+    "3mp": (2048, 1536),
+    "8mp": (3264, 2448),
+    "12mp": (4032, 3024),
+}
+
+
+def _make_photo(path: str, size: Tuple[int, int]) -> None:
+    """Write a synthetic photo that compresses like a real one (smooth gradient plus sensor noise)."""
+    from PIL import Image
+
+    w, h = size
+    gradient = Image.linear_gradient("L").resize((w, h)).convert("RGB")
+    noise = Image.effect_noise((w, h), 40).convert("RGB")
+    Image.blend(gradient, noise, 0.35).save(path, format="JPEG", quality=92)
+
+
+def _benchmarks(workdir: str) -> List[Tuple[str, Callable[[], Any]]]:
+    benches: List[Tuple[str, Callable[[], Any]]] = []
+
+    photos = {}
+    for label, size in PHOTO_SIZES.items():
+        path = os.path.join(workdir, f"photo_{label}.jpg")
+        _make_photo(path, size)
+        photos[label] = path
+        benches.append((f"compress_image[{label}]", lambda p=path: compress_image(p, max_size_kb=900)))
+
+    assets = {
+        "bg": bg_path, "dress_m": img3_m, "dress_f": img3_f, "dress_b": img3_b, "dress_g": img3_g,
+        "audio_m": audio_m, "audio_f": audio_f, "audio_b": audio_b, "audio_g": audio_g,
+    }
+    for label, path in assets.items():
+        if not os.path.exists(path):
+            print(f"skip file_to_base64[{label}]: {path} not found")
+            continue
+        compress = not path.endswith(".mp3")
+        benches.append((f"file_to_base64[{label}]", lambda p=path, c=compress: file_to_base64(p, compress=c)))
+        benches.append((f"asset_to_base64[{label}]", lambda p=path, c=compress: asset_to_base64(p, compress=c)))
+
+    video_url = "https://cdn.example.com/uae-national-day/videos/0f8fad5b-d9cb-469f-a165-70867728950e.mp4"
+
+    def qr_png():
+        # Mirrors api.main.job_qr: build the QR image, then re-encode it as PNG
+        buf = io.BytesIO()
+        generate_qr_code(video_url).save(buf, format="PNG")
+        return buf
+
+    benches.append(("generate_qr_code+png", qr_png))
+
+    benches.append(("quiz.get_random_questions", lambda: get_random_questions(count=10, seed="0501234567")))
+    questions = get_random_questions(count=10, seed="0501234567")
+    answers = [q["answer"] for q in questions]
+    benches.append(("quiz.grade_answers", lambda: grade_answers(questions, answers)))
+
+    # Body bytes from the per-profile pre-serialized template (user photo encode + splice)
+    for category in get_registry().names():
+        benches.append((
+            f"nano_banana_payload[{category}]",
+            lambda c=category: _nano_banana_payload(photos["12mp"], c),
+        ))
+
+    return benches
+
+
+def _measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    # The pipeline functions log progress with print(); keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()  # warm-up: imports, file cache, lazy initialisation
+
+        timings = []
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - begin)
+
+        # Memory is measured on a separate run so tracing overhead doesn't skew timings
+        blocks_before = sys.getallocatedblocks()
+        tracemalloc.start()
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        net_blocks = sys.getallocatedblocks() - blocks_before
+        del result
+
+    return {
+        "mean_ms": statistics.fmean(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "peak_kb": peak / 1024,
+        "net_blocks": net_blocks,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_table(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]]) -> None:
+    header = f"{'benchmark':36} {'median ms':>10} {'min ms':>9} {'peak KB':>10} {'net blocks':>11}"
+    if baseline:
+        header += f" {'vs base':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        line = f"{name:36} {r['median_ms']:10.2f} {r['min_ms']:9.2f} {r['peak_kb']:10.1f} {r['net_blocks']:11d}"
+        if baseline and name in baseline:
+            base = baseline[name]["median_ms"]
+            line += f" {(r['median_ms'] / base - 1) * 100 if base else 0:+7.1f}%"
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark (default 5)")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--save", metavar="NAME", help="save results as baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare against baselines/NAME.json")
+    parser.add_argument(
+        "--threshold", type=float, default=0.10,
+        help="relative median slowdown treated as a regression with --compare (default 0.10)",
+    )
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json"), "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, fn in _benchmarks(workdir):
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = _measure(fn, args.repeat)
+
+    _print_table(results, baseline)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save}.json")
+        meta = {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "timestamp": int(time.time()),
+            "repeat": args.repeat,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"Saved baseline: {path}")
+
+    if baseline:
+        regressions = [
+            name for name, r in results.items()
+            if name in baseline and baseline[name]["median_ms"]
+            and r["median_ms"] > baseline[name]["median_ms"] * (1 + args.threshold)
+        ]
+        if regressions:
+            print(f"Regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import threading
+import time
+from typing import Optional
+
+
+class JobCancelled(Exception):
+    """Raised inside a pipeline stage once its job has been cancelled."""
+
+
+class DeadlineExceeded(JobCancelled):
+    """Raised inside a pipeline stage once its job ran past its deadline."""
+
+
+class CancelToken:
+    """
+    Cancellation flag plus optional deadline shared by every stage of one job.
+
+    Stages call `check()` between units of work, use `sleep()` instead of
+    `time.sleep()` so a cancel wakes them immediately, and bound network calls
+    with `timeout()` so no single request can outlive the job's deadline.
+    """
+
+    def __init__(self, deadline_s: Optional[float] = None):
+        self._event = threading.Event()
+        self._reason = "cancelled"
+        self.deadline = time.monotonic() + deadline_s if deadline_s else None
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        self._reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None when there is no deadline."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise JobCancelled(self._reason)
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("job deadline exceeded")
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep up to `seconds`, waking early (and raising) on cancel or deadline."""
+        self.check()
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        self._event.wait(max(seconds, 0))
+        self.check()
+
+    def timeout(self, default: float) -> float:
+        """Clamp a per-request timeout so it never runs past the deadline."""
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return max(min(default, remaining), 0.1)
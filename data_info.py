@@ -6,49 +6,28 @@ BASE = os.path.join(os.path.dirname(__file__), "data")
 # 1) Define Local Paths for qwen/image assets
 bg_path = os.path.join(BASE, "newbg.png")
 
-img3_m = os.path.join(BASE, "male", "dress2.jpeg")
-prompt_m = (
-    "The man is wearing Emirati thobe. He is in the foreground against a studio "
-    "background featuring an illustrated Dubai skyline with the flag , in a clean minimal "
-    "line art style with beige and brown tones. half-body image. Professional studio "
-    "photography, even lighting, clean composition."
-)
-
-img3_f = os.path.join(BASE, "female", "dress.jpeg")
-prompt_f = (
-    "The woman is wearing a black abaya with UAE flag colors embellished panel and beige hijab. "
-    "She is in the foreground against a studio background featuring an illustrated Dubai skyline with the flag. "
-    "half-body image,Professional photography, natural daylight, clear sky, realistic composition."
-)
-
-img3_b = os.path.join(BASE, "boy", "dress.jpg")
-prompt_b = (
-    "The boy is wearing Emirati thobe. He is in the foreground against a studio background featuring "
-    "an illustrated Dubai skyline with the flag , in a clean minimal line art style with beige and brown tones. "
-    "half-body image .Professional studio photography, even lighting, clean composition."
-)
-
-# The repository contains `data/girl/dress.jpeg` so use the `.jpeg` extension here
-img3_g = os.path.join(BASE, "girl", "dress.jpeg")
-prompt_g = (
-    "The girl is wearing a UAE flag colors dress. She is in the foreground against a studio background "
-    "featuring an illustrated Dubai skyline with the flag. half-body image,  Professional photography, "
-    "natural daylight, clear sky, realistic composition"
-)
-
-
-# 2) Define Local Paths for wan (audio + prompts)
-audio_m = os.path.join(BASE, "male", "audio1.mp3")
-prompt_mw = "The Man is singing UAE national anthem singing"
-
-audio_f = os.path.join(BASE, "female", "audio1.mp3")
-prompt_fw = "The woman singing UAE national anthem singing."
-
-audio_b = os.path.join(BASE, "boy", "audio1.mp3")
-prompt_bw = "The boy is singing UAE national anthem singing."
-
-audio_g = os.path.join(BASE, "girl", "audio1.mp3")
-prompt_gw = "The girl is singing UAE national anthem singing."
+# 2) Per-category assets and prompts live in data/profiles.json (see profiles.py).
+# The names below are kept for existing imports and mirror the base profiles;
+# they are resolved on first access so importing this module stays cheap.
+_LEGACY_NAMES = {
+    "img3_m": ("Male", "dress"), "prompt_m": ("Male", "image_prompt"),
+    "img3_f": ("Female", "dress"), "prompt_f": ("Female", "image_prompt"),
+    "img3_b": ("Boy", "dress"), "prompt_b": ("Boy", "image_prompt"),
+    "img3_g": ("Girl", "dress"), "prompt_g": ("Girl", "image_prompt"),
+    "audio_m": ("Male", "audio"), "prompt_mw": ("Male", "video_prompt"),
+    "audio_f": ("Female", "audio"), "prompt_fw": ("Female", "video_prompt"),
+    "audio_b": ("Boy", "audio"), "prompt_bw": ("Boy", "video_prompt"),
+    "audio_g": ("Girl", "audio"), "prompt_gw": ("Girl", "video_prompt"),
+}
+
+
+def __getattr__(name):
+    if name not in _LEGACY_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from profiles import get_registry
+
+    profile, field = _LEGACY_NAMES[name]
+    return getattr(get_registry().profiles[profile], field)
 
 
 def validate_asset_paths(verbose: bool = True) -> bool:
@@ -56,17 +35,12 @@ def validate_asset_paths(verbose: bool = True) -> bool:
 
     Use this in development or in CI smoke tests to detect missing files early.
     """
-    required = {
-        "bg_path": bg_path,
-        "img3_m": img3_m,
-        "img3_f": img3_f,
-        "img3_b": img3_b,
-        "img3_g": img3_g,
-        "audio_m": audio_m,
-        "audio_f": audio_f,
-        "audio_b": audio_b,
-        "audio_g": audio_g,
-    }
+    from profiles import get_registry
+
+    required = {"bg_path": bg_path}
+    for profile in get_registry().profiles.values():
+        for kind in ("dress", "background", "audio"):
+            required[f"{profile.name}.{kind}"] = getattr(profile, kind)
 
     missing = []
     for name, p in required.items():
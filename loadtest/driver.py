@@ -0,0 +1,237 @@
+"""
+Load driver for api/main.py.
+
+Closed loop: fire N jobs with at most C in flight, polling each until it finishes.
+
+    python loadtest/driver.py --api http://127.0.0.1:8000 --jobs 200 --concurrency 50 --pid <api pid>
+
+Replay: re-issue recorded traffic from a JSONL log at a configurable speed-up.
+Each line is one job, e.g. {"offset_s": 12.5, "age_group": "Girl", "phone": "0501234567"};
+an absolute "ts" (epoch seconds) may be used instead of "offset_s", and "image"
+may name a photo to upload.
+
+    python loadtest/driver.py --replay traffic.jsonl --speedup 10 --pid <api pid>
+
+Reports throughput, p50/p95/p99 time-to-completed, and, with --pid, the API
+process's peak thread count and RSS (read from /proc).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Any, List, Optional
+
+import requests
+
+TERMINAL = {"completed", "failed", "cancelled"}
+AGE_GROUPS = ["Male", "Female", "Boy", "Girl"]
+
+
+def synthetic_photo() -> bytes:
+    """A ~1.5 MB phone-sized JPEG so uploads and compression see realistic input."""
+    from PIL import Image
+
+    gradient = Image.linear_gradient("L").resize((3024, 4032)).convert("RGB")
+    noise = Image.effect_noise((3024, 4032), 40).convert("RGB")
+    buf = BytesIO()
+    Image.blend(gradient, noise, 0.35).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    idx = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+class ProcessSampler(threading.Thread):
+    """Samples thread count and RSS of a local process from /proc/<pid>/status."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.max_threads = 0
+        self.max_rss_kb = 0
+        self._stop_event = threading.Event()
+
+    def sample(self) -> Dict[str, int]:
+        values = {}
+        with open(f"/proc/{self.pid}/status", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Threads", "VmRSS"):
+                    values[key] = int(rest.split()[0])
+        return values
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                values = self.sample()
+            except OSError:
+                return
+            self.max_threads = max(self.max_threads, values.get("Threads", 0))
+            self.max_rss_kb = max(self.max_rss_kb, values.get("VmRSS", 0))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class Driver:
+    def __init__(self, args: argparse.Namespace):
+        self.api = args.api.rstrip("/")
+        self.poll_interval = args.poll_interval
+        self.timeout = args.timeout
+        self.default_image = open(args.image, "rb").read() if args.image else synthetic_photo()
+        self.session_local = threading.local()
+        self.results: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self.session_local, "s"):
+            self.session_local.s = requests.Session()
+        return self.session_local.s
+
+    def run_job(self, item: Dict[str, Any]) -> None:
+        s = self._session()
+        image = open(item["image"], "rb").read() if item.get("image") else self.default_image
+        # Trailing bytes after the JPEG end marker make every upload unique, so the
+        # API's result reuse (same photo + profile) can't turn jobs into cache hits
+        image += os.urandom(16)
+        fields = {"age_group": item.get("age_group") or random.choice(AGE_GROUPS)}
+        if item.get("phone"):
+            fields["phone"] = item["phone"]
+        rec: Dict[str, Any] = {"submitted_at": time.time()}
+        try:
+            resp = s.post(
+                f"{self.api}/api/jobs",
+                files={"image": ("photo.jpg", image, "image/jpeg")},
+                data=fields,
+                timeout=60,
+            )
+            rec["submit_s"] = time.time() - rec["submitted_at"]
+            if resp.status_code != 200:
+                rec["status"] = f"http_{resp.status_code}"
+                return
+            job_id = resp.json()["job_id"]
+            deadline = time.time() + self.timeout
+            status = "queued"
+            while time.time() < deadline:
+                time.sleep(self.poll_interval)
+                status = s.get(f"{self.api}/api/jobs/{job_id}", timeout=30).json().get("status")
+                if status in TERMINAL:
+                    break
+            else:
+                status = "driver_timeout"
+            rec["status"] = status
+            rec["done_s"] = time.time() - rec["submitted_at"]
+        except requests.RequestException as e:
+            rec["status"] = f"error:{type(e).__name__}"
+        finally:
+            with self.lock:
+                self.results.append(rec)
+
+    def closed_loop(self, jobs: int, concurrency: int) -> None:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(jobs):
+                pool.submit(self.run_job, {})
+
+    def replay(self, path: str, speedup: float, max_workers: int) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            items = [json.loads(line) for line in f if line.strip()]
+        if not items:
+            return
+        if "offset_s" not in items[0]:
+            first_ts = min(i["ts"] for i in items)
+            for i in items:
+                i["offset_s"] = i["ts"] - first_ts
+        items.sort(key=lambda i: i["offset_s"])
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for item in items:
+                delay = start + item["offset_s"] / speedup - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.run_job, item)
+
+
+def report(results: List[Dict[str, Any]], wall_s: float, sampler: Optional[ProcessSampler]) -> Dict[str, Any]:
+    counts: Dict[str, int] = {}
+    for r in results:
+        counts[r.get("status", "unknown")] = counts.get(r.get("status", "unknown"), 0) + 1
+    done = [r["done_s"] for r in results if r.get("status") == "completed"]
+    submits = [r["submit_s"] for r in results if "submit_s" in r]
+    summary = {
+        "jobs": len(results),
+        "statuses": counts,
+        "wall_s": round(wall_s, 1),
+        "completed_per_min": round(len(done) / wall_s * 60, 2) if wall_s else 0,
+        "time_to_completed_s": {
+            "p50": percentile(done, 50),
+            "p95": percentile(done, 95),
+            "p99": percentile(done, 99),
+            "mean": statistics.fmean(done) if done else None,
+        },
+        "submit_s": {"p50": percentile(submits, 50), "p95": percentile(submits, 95)},
+    }
+    if sampler:
+        summary["api_max_threads"] = sampler.max_threads
+        summary["api_max_rss_mb"] = round(sampler.max_rss_kb / 1024, 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--jobs", type=int, default=50, help="jobs to fire in closed-loop mode")
+    parser.add_argument("--concurrency", type=int, default=10, help="jobs in flight in closed-loop mode")
+    parser.add_argument("--replay", metavar="JSONL", help="replay recorded traffic instead of a closed loop")
+    parser.add_argument("--speedup", type=float, default=1.0, help="replay time compression factor")
+    parser.add_argument("--image", help="photo to upload (default: synthetic 12 MP JPEG)")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="status poll interval, like the frontend")
+    parser.add_argument("--timeout", type=float, default=900, help="give up on a job after this many seconds")
+    parser.add_argument("--pid", type=int, help="API process id to sample threads and RSS from /proc")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    driver = Driver(args)
+    sampler = ProcessSampler(args.pid) if args.pid and os.path.exists(f"/proc/{args.pid}") else None
+    if sampler:
+        sampler.start()
+
+    begin = time.time()
+    if args.replay:
+        driver.replay(args.replay, args.speedup, max_workers=max(args.concurrency, 256))
+    else:
+        driver.closed_loop(args.jobs, args.concurrency)
+    wall = time.time() - begin
+
+    if sampler:
+        sampler.stop()
+    summary = report(driver.results, wall, sampler)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    ttc = summary["time_to_completed_s"]
+    fmt = lambda v: f"{v:.1f}s" if v is not None else "-"
+    print(f"jobs: {summary['jobs']}  wall: {summary['wall_s']}s  statuses: {summary['statuses']}")
+    print(f"throughput: {summary['completed_per_min']} completed/min")
+    print(f"time to completed: p50 {fmt(ttc['p50'])}  p95 {fmt(ttc['p95'])}  p99 {fmt(ttc['p99'])}")
+    print(f"submit latency: p50 {fmt(summary['submit_s']['p50'])}  p95 {fmt(summary['submit_s']['p95'])}")
+    if sampler:
+        print(f"api process: max threads {summary['api_max_threads']}  max RSS {summary['api_max_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Minimal in-memory S3 stand-in for load tests.
+
+Speaks just enough of the S3 REST API (path-style) for boto3's head_bucket,
+put_object, upload_file/upload_fileobj (including multipart uploads) and
+presigned GETs with Range support. Signatures are not checked.
+
+    python loadtest/fake_s3.py --port 9200
+
+then run the API with AWS_S3_ENDPOINT_URL=http://127.0.0.1:9200 and any
+non-empty AWS credentials.
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs, unquote
+
+
+def decode_aws_chunked(body: bytes) -> bytes:
+    """Strip aws-chunked framing ("<hex>;chunk-signature=...\\r\\n<data>\\r\\n", trailers after the 0 chunk)."""
+    out = bytearray()
+    pos = 0
+    while True:
+        line_end = body.index(b"\r\n", pos)
+        size = int(body[pos:line_end].split(b";")[0], 16)
+        pos = line_end + 2
+        if size == 0:
+            return bytes(out)
+        out += body[pos:pos + size]
+        pos += size + 2
+
+
+class FakeS3:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.objects: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.uploads: Dict[str, Dict[int, bytes]] = {}
+        self.lock = threading.Lock()
+        self.stats = {"puts": 0, "gets": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def make_handler(fake: FakeS3):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _parse(self) -> Tuple[str, str, Dict[str, list]]:
+            parts = urlsplit(self.path)
+            path = unquote(parts.path).lstrip("/")
+            bucket, _, key = path.partition("/")
+            return bucket, key, parse_qs(parts.query, keep_blank_values=True)
+
+        def _body(self) -> bytes:
+            if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                raw = bytearray()
+                while True:
+                    size = int(self.rfile.readline().split(b";")[0], 16)
+                    if size == 0:
+                        while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                            pass
+                        break
+                    raw += self.rfile.read(size)
+                    self.rfile.readline()
+                body = bytes(raw)
+            else:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            sha = self.headers.get("x-amz-content-sha256", "")
+            if "aws-chunked" in self.headers.get("Content-Encoding", "") or sha.startswith("STREAMING-"):
+                body = decode_aws_chunked(body)
+            return body
+
+        def _send(self, status: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None, head=False):
+            self.send_response(status)
+            headers = headers or {}
+            headers.setdefault("Content-Length", str(len(body)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            if body and not head:
+                self.wfile.write(body)
+
+        def _xml(self, status: int, xml: str):
+            self._send(status, xml.encode(), {"Content-Type": "application/xml"})
+
+        def do_HEAD(self):
+            self._get(head=True)
+
+        def do_GET(self):
+            self._get(head=False)
+
+        def _get(self, head: bool):
+            time.sleep(fake.latency)
+            bucket, key, _ = self._parse()
+            if bucket == "_stats":
+                with fake.lock:
+                    stats = dict(fake.stats, objects=len(fake.objects))
+                return self._send(200, json.dumps(stats).encode(), {"Content-Type": "application/json"})
+            if not key:
+                return self._send(200, head=head)  # head_bucket / any bucket exists
+            with fake.lock:
+                obj = fake.objects.get((bucket, key))
+            if obj is None:
+                return self._xml(404, "<Error><Code>NoSuchKey</Code></Error>")
+            data = obj["data"]
+            headers = {
+                "Content-Type": obj["content_type"],
+                "ETag": obj["etag"],
+                "Accept-Ranges": "bytes",
+            }
+            for name in ("Cache-Control", "Content-Disposition"):
+                if obj.get(name):
+                    headers[name] = obj[name]
+            status = 200
+            rng = self.headers.get("Range", "")
+            if rng.startswith("bytes="):
+                start_s, _, end_s = rng[6:].partition("-")
+                if start_s:
+                    start, end = int(start_s), int(end_s) if end_s else len(data) - 1
+                else:
+                    start, end = max(len(data) - int(end_s), 0), len(data) - 1
+                end = min(end, len(data) - 1)
+                headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+                data = data[start:end + 1]
+                status = 206
+            with fake.lock:
+                fake.stats["gets"] += 1
+                fake.stats["bytes_out"] += 0 if head else len(data)
+            self._send(status, data, headers, head=head)
+
+        def do_PUT(self):
+            time.sleep(fake.latency)
+            bucket, key, query = self._parse()
+            body = self._body()
+            if "uploadId" in query:
+                part = int(query["partNumber"][0])
+                with fake.lock:
+                    fake.uploads[query["uploadId"][0]][part] = body
+                return self._send(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+            self._store(bucket, key, body)
+            self._send(200, headers={"ETag": fake.objects[(bucket, key)]["etag"]})
+
+        def do_POST(self):
+            time.sleep(fake.latency)
+            bucket, key, query = self._parse()
+            self._body()
+            if "uploads" in query:
+                upload_id = uuid.uuid4().hex
+                with fake.lock:
+                    fake.uploads[upload_id] = {}
+                return self._xml(200, (
+                    "<InitiateMultipartUploadResult>"
+                    f"<Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>"
+                    "</InitiateMultipartUploadResult>"
+                ))
+            if "uploadId" in query:
+                with fake.lock:
+                    parts = fake.uploads.pop(query["uploadId"][0])
+                self._store(bucket, key, b"".join(parts[n] for n in sorted(parts)))
+                return self._xml(200, (
+                    "<CompleteMultipartUploadResult>"
+                    f"<Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>{fake.objects[(bucket, key)]['etag']}</ETag>"
+                    "</CompleteMultipartUploadResult>"
+                ))
+            self._xml(400, "<Error><Code>NotImplemented</Code></Error>")
+
+        def do_DELETE(self):
+            bucket, key, query = self._parse()
+            with fake.lock:
+                if "uploadId" in query:
+                    fake.uploads.pop(query["uploadId"][0], None)
+                else:
+                    fake.objects.pop((bucket, key), None)
+            self._send(204)
+
+        def _store(self, bucket: str, key: str, body: bytes):
+            obj = {
+                "data": body,
+                "etag": f'"{hashlib.md5(body).hexdigest()}"',
+                "content_type": self.headers.get("Content-Type", "binary/octet-stream"),
+                "Cache-Control": self.headers.get("Cache-Control"),
+                "Content-Disposition": self.headers.get("Content-Disposition"),
+            }
+            with fake.lock:
+                fake.objects[(bucket, key)] = obj
+                fake.stats["puts"] += 1
+                fake.stats["bytes_in"] += len(body)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency", type=float, default=0.0, help="added seconds per request")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeS3(args.latency)))
+    server.daemon_threads = True
+    print(f"Fake S3 listening on http://{args.host}:{args.port} (stats at /_stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Local stand-in for the WaveSpeed API, for load-testing api/main.py without paying for generations.
+
+Implements the endpoints wave.py uses: model submits, prediction result polling,
+prediction cancel, plus the output URLs the predictions resolve to. Latency,
+failure and rate-limit behaviour are configurable:
+
+    python loadtest/fake_wavespeed.py --port 9100 \\
+        --image-latency lognormal:12:0.3 --video-latency lognormal:45:0.25 \\
+        --failure-rate 0.02 --rate-limit-rate 0.05
+
+then run the API with WAVESPEED_BASE_URL=http://127.0.0.1:9100/api/v3.
+
+Latency specs: `fixed:S`, `uniform:A:B`, `lognormal:MEDIAN:SIGMA` (seconds).
+"""
+import argparse
+import json
+import math
+import random
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Callable, Dict, Any
+
+SUBMIT_PATHS = {
+    "/api/v3/google/nano-banana-pro/edit": "image",
+    "/api/v3/wavespeed-ai/wan-2.2/speech-to-video": "video",
+}
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    kind, *args = spec.split(":")
+    nums = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda: nums[0]
+    if kind == "uniform":
+        return lambda: random.uniform(nums[0], nums[1])
+    if kind == "lognormal":
+        median, sigma = nums
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise argparse.ArgumentTypeError(f"unknown latency spec: {spec}")
+
+
+def _box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + kind + payload
+
+
+def fake_mp4(mdat_size: int) -> bytes:
+    """
+    A structurally valid MP4 (ftyp, mdat, then moov with a chunk-offset table),
+    laid out like an encoder that writes moov last. Not playable; it exists so
+    downloads, uploads and box rewrites see realistic sizes and layout.
+    """
+    ftyp = _box(b"ftyp", b"isom" + struct.pack(">I", 0x200) + b"isommp41")
+    mdat = _box(b"mdat", bytes(mdat_size))
+    mvhd = _box(
+        b"mvhd",
+        struct.pack(">I4I", 0, 0, 0, 1000, 10000)
+        + struct.pack(">IH10x", 0x00010000, 0x0100)
+        + struct.pack(">9I", 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+        + bytes(24)
+        + struct.pack(">I", 2),
+    )
+    # Four chunks spread through mdat, offsets relative to the start of the file
+    first = len(ftyp) + 8
+    offsets = [first + i * (mdat_size // 4) for i in range(4)]
+    stco = _box(b"stco", struct.pack(">II", 0, len(offsets)) + b"".join(struct.pack(">I", o) for o in offsets))
+    trak = _box(b"trak", _box(b"mdia", _box(b"minf", _box(b"stbl", stco))))
+    moov = _box(b"moov", mvhd + trak)
+    return ftyp + mdat + moov
+
+
+def fake_jpeg(width: int = 576, height: int = 1024) -> bytes:
+    try:
+        from PIL import Image
+    except ImportError:
+        # Smallest valid-looking JPEG markers; enough for byte-level handling
+        return b"\xff\xd8\xff\xe0" + bytes(2048) + b"\xff\xd9"
+    buf = BytesIO()
+    Image.new("RGB", (width, height), (196, 170, 130)).save(buf, format="JPEG", quality=80)
+    return buf.getvalue()
+
+
+class FakeWaveSpeed:
+    def __init__(self, args: argparse.Namespace):
+        self.latency = {"image": parse_latency(args.image_latency), "video": parse_latency(args.video_latency)}
+        self.failure_rate = args.failure_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.predictions: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.outputs = {"image": fake_jpeg(), "video": fake_mp4(args.video_kb * 1024)}
+        self.stats = {"submits": 0, "polls": 0, "rate_limited": 0, "cancelled": 0}
+
+    def submit(self, kind: str) -> Dict[str, Any]:
+        pred_id = uuid.uuid4().hex
+        pred = {
+            "id": pred_id,
+            "kind": kind,
+            "ready_at": time.time() + self.latency[kind](),
+            "fails": random.random() < self.failure_rate,
+            "cancelled": False,
+        }
+        with self.lock:
+            self.predictions[pred_id] = pred
+            self.stats["submits"] += 1
+        return {"id": pred_id, "status": "created"}
+
+    def result(self, pred_id: str, base_url: str) -> Dict[str, Any]:
+        with self.lock:
+            pred = self.predictions.get(pred_id)
+            self.stats["polls"] += 1
+        if pred is None:
+            return None
+        if pred["cancelled"]:
+            return {"id": pred_id, "status": "failed", "error": "cancelled"}
+        if time.time() < pred["ready_at"]:
+            return {"id": pred_id, "status": "processing"}
+        if pred["fails"]:
+            return {"id": pred_id, "status": "failed", "error": "simulated provider failure"}
+        ext = "jpeg" if pred["kind"] == "image" else "mp4"
+        return {"id": pred_id, "status": "completed", "outputs": [f"{base_url}/outputs/{pred_id}.{ext}"]}
+
+    def cancel(self, pred_id: str) -> bool:
+        with self.lock:
+            pred = self.predictions.get(pred_id)
+            if pred is None:
+                return False
+            pred["cancelled"] = True
+            self.stats["cancelled"] += 1
+            return True
+
+    def rate_limited(self) -> bool:
+        if random.random() < self.rate_limit_rate:
+            with self.lock:
+                self.stats["rate_limited"] += 1
+            return True
+        return False
+
+
+def make_handler(fake: FakeWaveSpeed):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status: int, data: Any, headers=None):
+            self._send(status, json.dumps({"code": status, "data": data}).encode(), headers=headers)
+
+        def _base_url(self) -> str:
+            return f"http://{self.headers.get('Host')}"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            if self.path in SUBMIT_PATHS:
+                if fake.rate_limited():
+                    return self._json(429, {"error": "rate limited"}, headers={"Retry-After": "1"})
+                return self._json(200, fake.submit(SUBMIT_PATHS[self.path]))
+            if self.path.startswith("/api/v3/predictions/") and self.path.endswith("/cancel"):
+                pred_id = self.path.split("/")[4]
+                return self._json(200 if fake.cancel(pred_id) else 404, {"id": pred_id})
+            self._json(404, {"error": "not found"})
+
+        def do_GET(self):
+            if self.path.startswith("/api/v3/predictions/") and self.path.endswith("/result"):
+                if fake.rate_limited():
+                    return self._json(429, {"error": "rate limited"}, headers={"Retry-After": "1"})
+                data = fake.result(self.path.split("/")[4], self._base_url())
+                return self._json(200 if data else 404, data)
+            if self.path.startswith("/outputs/"):
+                kind = "image" if self.path.endswith(".jpeg") else "video"
+                ctype = "image/jpeg" if kind == "image" else "video/mp4"
+                return self._send(200, fake.outputs[kind], content_type=ctype)
+            if self.path == "/stats":
+                with fake.lock:
+                    stats = dict(fake.stats, predictions=len(fake.predictions))
+                return self._send(200, json.dumps(stats).encode())
+            self._json(404, {"error": "not found"})
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    # Defaults stay well inside wave.py's poll budgets (~36 s image, ~120 s video),
+    # so timeouts only show up when a test asks for slower latencies on purpose
+    parser.add_argument("--image-latency", default="lognormal:12:0.3", help="image edit latency spec")
+    parser.add_argument("--video-latency", default="lognormal:45:0.25", help="video generation latency spec")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of predictions that fail")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--video-kb", type=int, default=2048, help="size of the generated video output")
+    args = parser.parse_args()
+
+    fake = FakeWaveSpeed(args)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    server.daemon_threads = True
+    print(f"Fake WaveSpeed listening on http://{args.host}:{args.port}/api/v3 (stats at /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# Seconds buckets spanning sub-millisecond CPU work up to multi-minute generations
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 20.0, 30.0, 60.0, 90.0, 120.0, 180.0, 300.0, 600.0,
+)
+
+_REGISTRY: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. polls or failures."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. jobs currently in a stage."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observations, e.g. stage latency in seconds."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][idx] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        """Observe the wall-clock duration of the enclosed block."""
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - begin, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v[0]), v[1]) for k, v in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    return "\n".join(m.render() for m in _REGISTRY) + "\n"
+
+
+# ---------------- Pipeline instruments ----------------
+
+QUEUE_WAIT_SECONDS = Histogram(
+    "uae_queue_wait_seconds", "Time a job waited for a worker slot, by scheduling class.", ["class"]
+)
+COMPRESSION_SECONDS = Histogram(
+    "uae_compression_seconds", "Time spent re-encoding an image before upload to the provider."
+)
+SUBMIT_SECONDS = Histogram(
+    "uae_submit_seconds", "Time to submit a prediction to WaveSpeed.", ["stage"]
+)
+IMAGE_EDIT_SECONDS = Histogram(
+    "uae_image_edit_seconds", "End-to-end image edit time (submit to completed)."
+)
+VIDEO_SECONDS = Histogram(
+    "uae_video_seconds", "End-to-end video generation time (submit to completed)."
+)
+DOWNLOAD_SECONDS = Histogram(
+    "uae_download_seconds", "Time to download a provider output.", ["kind"]
+)
+S3_UPLOAD_SECONDS = Histogram(
+    "uae_s3_upload_seconds", "Time to upload an object to S3.", ["kind"]
+)
+PREVIEW_SECONDS = Histogram(
+    "uae_preview_seconds", "Time to render the local preview composite."
+)
+POLLS_PER_PREDICTION = Histogram(
+    "uae_polls_per_prediction",
+    "Result polls issued per WaveSpeed prediction.",
+    ["stage"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 200, 360),
+)
+
+POLLS_TOTAL = Counter(
+    "uae_provider_polls_total", "WaveSpeed result polls issued.", ["stage"]
+)
+RETRIES_TOTAL = Counter(
+    "uae_provider_retries_total", "WaveSpeed requests retried after a transient error.", ["stage"]
+)
+FAILURES_TOTAL = Counter(
+    "uae_job_failures_total", "Failed jobs by the stage they failed in and the cause.", ["stage", "cause"]
+)
+JOBS_TOTAL = Counter(
+    "uae_jobs_total", "Jobs reaching a terminal state.", ["status"]
+)
+
+JOBS_IN_FLIGHT = Gauge(
+    "uae_jobs_in_flight", "Jobs currently in each pipeline stage.", ["stage"]
+)
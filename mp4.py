@@ -0,0 +1,99 @@
+"""
+Pure-Python MP4 "faststart": move the moov box in front of mdat so players can
+start before the whole file has arrived. No re-encode; only the chunk-offset
+tables (stco/co64) are patched to account for the moved bytes.
+"""
+import struct
+from typing import List, Tuple
+
+# Boxes on the path from moov down to the chunk-offset tables
+_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+def _boxes(data, start: int, end: int) -> List[Tuple[bytes, int, int, int]]:
+    """List (type, box start, payload start, box end) for the boxes in data[start:end]."""
+    out = []
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                raise ValueError("truncated 64-bit box header")
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos  # box runs to the end of its parent
+        if size < header or pos + size > end:
+            raise ValueError(f"bad size for box {kind!r} at {pos}")
+        out.append((kind, pos, pos + header, pos + size))
+        pos += size
+    return out
+
+
+def _shift_offsets(moov: bytearray, start: int, end: int, delta: int, lo: int, hi: int) -> None:
+    """Add `delta` to every chunk offset in [lo, hi); offsets outside that range stay put."""
+    for kind, _, body, box_end in _boxes(moov, start, end):
+        if kind in _CONTAINERS:
+            _shift_offsets(moov, body, box_end, delta, lo, hi)
+        elif kind in (b"stco", b"co64"):
+            count = struct.unpack_from(">I", moov, body + 4)[0]
+            fmt, width = (">I", 4) if kind == b"stco" else (">Q", 8)
+            pos = body + 8
+            for _ in range(count):
+                value = struct.unpack_from(fmt, moov, pos)[0]
+                if lo <= value < hi:
+                    value += delta
+                    if kind == b"stco" and value > 0xFFFFFFFF:
+                        raise OverflowError("stco offset overflow")
+                    struct.pack_into(fmt, moov, pos, value)
+                pos += width
+
+
+def needs_faststart(data: bytes) -> bool:
+    """True when the top-level moov box comes after mdat."""
+    try:
+        kinds = [kind for kind, *_ in _boxes(data, 0, len(data))]
+    except ValueError:
+        return False
+    if b"moov" not in kinds or b"mdat" not in kinds:
+        return False
+    return kinds.index(b"moov") > kinds.index(b"mdat")
+
+
+def faststart(data: bytes) -> bytes:
+    """
+    Return `data` with moov relocated before the first mdat. Files that are
+    already faststart, fragmented, or can't be parsed are returned unchanged.
+    """
+    try:
+        top = _boxes(data, 0, len(data))
+    except ValueError as e:
+        print(f"faststart: not rewriting, {e}")
+        return data
+
+    kinds = [kind for kind, *_ in top]
+    if b"moof" in kinds or not needs_faststart(data):
+        return data
+
+    moov_box = next(b for b in top if b[0] == b"moov")
+    first_mdat = next(b for b in top if b[0] == b"mdat")
+    _, moov_start, moov_body, moov_end = moov_box
+
+    # Bytes between the first mdat and moov move down by the size of moov;
+    # anything after moov (e.g. a second mdat) keeps its position
+    moov = bytearray(data[moov_start:moov_end])
+    try:
+        _shift_offsets(moov, moov_body - moov_start, len(moov), len(moov), first_mdat[1], moov_start)
+    except (OverflowError, ValueError, struct.error) as e:
+        print(f"faststart: not rewriting, {e}")
+        return data
+
+    insert_at = first_mdat[1]
+    return b"".join((
+        data[:insert_at],
+        bytes(moov),
+        data[insert_at:moov_start],
+        data[moov_end:],
+    ))
+
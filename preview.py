@@ -0,0 +1,80 @@
+"""
+Instant preview: the guest's photo framed on the event background (data/newbg.png),
+rendered locally in a few hundred milliseconds while the AI pipeline runs.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+from typing import Optional
+
+from data_info import bg_path
+import metrics
+import tracing
+
+PREVIEW_WIDTH = int(os.getenv("PREVIEW_WIDTH", "540"))
+# Previews kept in memory for the status endpoint
+PREVIEW_CACHE_SIZE = int(os.getenv("PREVIEW_CACHE_SIZE", "500"))
+
+# Photo box relative to the background: width, height, top edge
+_PHOTO_BOX = (0.62, 0.52, 0.2)
+_BORDER = 6
+
+_CACHE: "OrderedDict[str, bytes]" = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=4)
+def _background(path: str, mtime_ns: int, width: int):
+    """Decoded, resized background; shared by every preview (callers must copy before drawing)."""
+    from PIL import Image
+
+    bg = Image.open(path).convert("RGB")
+    height = round(bg.height * width / bg.width)
+    return bg.resize((width, height), Image.BILINEAR)
+
+
+def render_preview(photo_path: str, width: int = PREVIEW_WIDTH):
+    """Composite the photo onto the background and return a PIL image."""
+    from PIL import Image, ImageOps
+
+    canvas = _background(bg_path, os.stat(bg_path).st_mtime_ns, width).copy()
+    box_w = int(canvas.width * _PHOTO_BOX[0])
+    box_h = int(canvas.height * _PHOTO_BOX[1])
+
+    photo = Image.open(photo_path)
+    photo.draft("RGB", (box_w, box_h))  # JPEG: decode at reduced scale, the main saving on phone photos
+    photo = ImageOps.exif_transpose(photo).convert("RGB")
+    photo.thumbnail((box_w - 2 * _BORDER, box_h - 2 * _BORDER), Image.BILINEAR)
+    framed = ImageOps.expand(photo, border=_BORDER, fill="white")
+
+    x = (canvas.width - framed.width) // 2
+    y = int(canvas.height * _PHOTO_BOX[2]) + (box_h - framed.height) // 2
+    canvas.paste(framed, (x, y))
+    return canvas
+
+
+def make_preview(photo_path: str, width: int = PREVIEW_WIDTH, quality: int = 80) -> bytes:
+    """Render the preview and encode it as JPEG bytes."""
+    begin = time.perf_counter()
+    with tracing.span("preview") as sp:
+        buf = BytesIO()
+        render_preview(photo_path, width).save(buf, format="JPEG", quality=quality)
+        sp.set(bytes=buf.tell())
+    metrics.PREVIEW_SECONDS.observe(time.perf_counter() - begin)
+    return buf.getvalue()
+
+
+def put(key: str, data: bytes) -> None:
+    with _CACHE_LOCK:
+        _CACHE[key] = data
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > PREVIEW_CACHE_SIZE:
+            _CACHE.popitem(last=False)
+
+
+def get(key: str) -> Optional[bytes]:
+    with _CACHE_LOCK:
+        return _CACHE.get(key)
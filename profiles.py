@@ -0,0 +1,176 @@
+"""
+Category profiles loaded from data/profiles.json.
+
+Each profile bundles the dress, background and audio assets, the image and
+video prompts and the WaveSpeed model parameters for one category (Male,
+Female, Boy, Girl, or a variant of one of them). `defaults` apply to every
+profile, and a profile may `extend` another. Each profile gets a version hash
+over its resolved config and asset bytes, so editing a prompt or replacing a
+dress image yields a new version.
+"""
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+PROFILES_FILE = os.getenv("PROFILES_FILE", os.path.join(DATA_DIR, "profiles.json"))
+
+_FIELDS = (
+    "dress", "background", "audio", "image_prompt", "video_prompt",
+    "image_endpoint", "image_params", "video_endpoint", "video_params",
+)
+# Placeholder marking where per-job data is spliced into a PayloadTemplate
+SLOT = "\x00slot\x00"
+
+
+@dataclass(frozen=True)
+class Profile:
+    name: str
+    dress: str
+    background: str
+    audio: str
+    image_prompt: str
+    video_prompt: str
+    image_endpoint: str
+    image_params: Dict[str, Any]
+    video_endpoint: str
+    video_params: Dict[str, Any]
+    version: str
+
+
+class PayloadTemplate:
+    """
+    A request body serialized once, with one slot for per-job data. Rendering
+    concatenates bytes instead of re-serializing the (large) static assets.
+    """
+
+    __slots__ = ("prefix", "suffix")
+
+    def __init__(self, payload: Dict[str, Any]):
+        text = json.dumps(payload)
+        marker = json.dumps(SLOT)
+        if text.count(marker) != 1:
+            raise ValueError("payload template needs exactly one slot")
+        prefix, _, suffix = text.partition(marker)
+        self.prefix = prefix.encode("utf-8")
+        self.suffix = suffix.encode("utf-8")
+
+    def render(self, value: str) -> bytes:
+        return b"".join((self.prefix, json.dumps(value).encode("utf-8"), self.suffix))
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+    except FileNotFoundError:
+        return "missing"
+    return h.hexdigest()
+
+
+def _resolve(name: str, raw: Dict[str, Dict[str, Any]], defaults: Dict[str, Any], seen: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    if name in seen:
+        raise ValueError(f"profile {name!r}: circular 'extends'")
+    entry = raw[name]
+    parent = entry.get("extends")
+    if parent is not None:
+        if parent not in raw:
+            raise ValueError(f"profile {name!r} extends unknown profile {parent!r}")
+        base = _resolve(parent, raw, defaults, seen + (name,))
+    else:
+        base = dict(defaults)
+    merged = dict(base)
+    for key, value in entry.items():
+        if key == "extends":
+            continue
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+
+def _build(name: str, cfg: Dict[str, Any]) -> Profile:
+    missing = [f for f in _FIELDS if f not in cfg]
+    if missing:
+        raise ValueError(f"profile {name!r} is missing {', '.join(missing)}")
+    values = {f: cfg[f] for f in _FIELDS}
+    for key in ("dress", "background", "audio"):
+        values[key] = os.path.join(DATA_DIR, values[key])
+
+    # Version: config as resolved plus the bytes of every asset it points at
+    h = hashlib.sha256(json.dumps({f: cfg[f] for f in _FIELDS}, sort_keys=True).encode("utf-8"))
+    for key in ("dress", "background", "audio"):
+        h.update(_file_digest(values[key]).encode("ascii"))
+    return Profile(name=name, version=h.hexdigest()[:12], **values)
+
+
+class Registry:
+    def __init__(self, profiles: Dict[str, Profile], mtime_ns: int):
+        self.profiles = profiles
+        self.mtime_ns = mtime_ns
+
+    def names(self) -> List[str]:
+        return list(self.profiles)
+
+    def get(self, name: str) -> Optional[Profile]:
+        return self.profiles.get(name)
+
+
+def load(path: str = PROFILES_FILE) -> Registry:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    raw = data.get("profiles") or {}
+    if not raw:
+        raise ValueError(f"{path} defines no profiles")
+    defaults = data.get("defaults", {})
+    profiles = {name: _build(name, _resolve(name, raw, defaults)) for name in raw}
+    return Registry(profiles, os.stat(path).st_mtime_ns)
+
+
+_registry: Optional[Registry] = None
+_registry_lock = threading.Lock()
+_failed_mtime_ns: Optional[int] = None  # broken file version already reported
+
+
+def get_registry() -> Registry:
+    """
+    The current registry, reloaded when the profiles file changes on disk. A
+    broken edit keeps the last good registry in service; with none loaded yet
+    the error propagates.
+    """
+    global _registry, _failed_mtime_ns
+    with _registry_lock:
+        mtime_ns = None
+        try:
+            mtime_ns = os.stat(PROFILES_FILE).st_mtime_ns
+            if _registry is not None and mtime_ns in (_registry.mtime_ns, _failed_mtime_ns):
+                return _registry
+            loaded = load(PROFILES_FILE)
+        except (OSError, ValueError) as e:
+            if _registry is None:
+                raise
+            if mtime_ns is None or mtime_ns != _failed_mtime_ns:
+                print(f"⚠️ Keeping previous profiles, reload of {PROFILES_FILE} failed: {e}")
+            _failed_mtime_ns = mtime_ns
+            return _registry
+        _registry = loaded
+        print(f"Loaded {len(_registry.profiles)} profiles: " + ", ".join(
+            f"{p.name}@{p.version}" for p in _registry.profiles.values()
+        ))
+        return _registry
+
+
+def resolve(profile) -> Profile:
+    """Accept a Profile or a profile name; raises ValueError for unknown names."""
+    if isinstance(profile, Profile):
+        return profile
+    found = get_registry().get(profile)
+    if found is None:
+        raise ValueError(f"unknown profile: {profile}")
+    return found
@@ -0,0 +1,203 @@
+"""
+Small HTTP server for results saved by the Gradio app (result/videos, result/images,
+result/posters), so phones that scan the QR code can stream them directly.
+
+Supports HTTP Range (single range), ETag/Last-Modified revalidation and
+zero-copy transfer via socket.sendfile, with a cap on concurrent transfers.
+"""
+import email.utils
+import mimetypes
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import quote, unquote, urlsplit
+
+from storage import RESULT_DIR, KINDS, STORE
+
+RESULT_SERVER_HOST = os.getenv("RESULT_SERVER_HOST", "0.0.0.0")
+RESULT_SERVER_PORT = int(os.getenv("RESULT_SERVER_PORT", "7861"))
+# Transfers in flight at once; further requests get 503 + Retry-After
+RESULT_SERVER_MAX_STREAMS = int(os.getenv("RESULT_SERVER_MAX_STREAMS", "32"))
+# Public base URL encoded in QR codes, e.g. http://192.168.1.20:7861 (default: this host's LAN address)
+RESULT_BASE_URL = os.getenv("RESULT_BASE_URL", "").rstrip("/")
+# Files are overwritten when a phone number is reused, so keep caching short and revalidate by ETag
+RESULT_SERVER_CACHE_CONTROL = os.getenv("RESULT_SERVER_CACHE_CONTROL", "public, max-age=300")
+
+# Only stored media is exposed; result/quiz holds personal data
+SERVED_DIRS = set(KINDS)
+# Resolved once so a symlinked result root still matches realpath() of served files
+_SERVED_ROOT = os.path.realpath(RESULT_DIR)
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+_streams = threading.BoundedSemaphore(RESULT_SERVER_MAX_STREAMS)
+
+
+def _lan_ip() -> str:
+    # Connecting a UDP socket sends nothing; it just picks the outbound interface
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(("10.255.255.255", 1))
+        return s.getsockname()[0]
+    except OSError:
+        return "127.0.0.1"
+    finally:
+        s.close()
+
+
+def base_url() -> str:
+    return RESULT_BASE_URL or f"http://{_lan_ip()}:{RESULT_SERVER_PORT}"
+
+
+def result_url(local_path: str) -> str:
+    """Public URL for a file saved under RESULT_DIR."""
+    rel = os.path.relpath(os.path.abspath(local_path), RESULT_DIR)
+    if rel.startswith(".."):
+        raise ValueError(f"{local_path} is outside {RESULT_DIR}")
+    return f"{base_url()}/{quote(rel.replace(os.sep, '/'))}"
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=" range into inclusive (start, end). Returns None to
+    serve the whole file (no/multi/invalid range, e.g. end before start, which
+    RFC 9110 says to ignore); raises ValueError if unsatisfiable (start past the end).
+    """
+    if not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, sep, end_s = header[6:].strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start_s:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+        else:
+            start, end = max(size - int(end_s), 0), size - 1
+    except ValueError:
+        return None
+    if end < start and end_s and start_s:
+        return None  # last-pos before first-pos: invalid, not unsatisfiable
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+class ResultHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = 60  # drop idle keep-alive connections
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def _resolve(self) -> Optional[str]:
+        rel = unquote(urlsplit(self.path).path).lstrip("/")
+        if rel.split("/", 1)[0] not in SERVED_DIRS:
+            return None
+        path = os.path.realpath(os.path.join(_SERVED_ROOT, rel))
+        if not path.startswith(_SERVED_ROOT + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def _send_headers(self, code: int, headers: dict) -> None:
+        self.send_response(code)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+
+    def _status(self, code: int, headers: Optional[dict] = None) -> None:
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _serve(self, head: bool) -> None:
+        path = self._resolve()
+        if path is None:
+            return self._status(404)
+
+        st = os.stat(path)
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": email.utils.formatdate(st.st_mtime, usegmt=True),
+            "Cache-Control": RESULT_SERVER_CACHE_CONTROL,
+            "Accept-Ranges": "bytes",
+        }
+
+        if self._not_modified(etag, st.st_mtime):
+            return self._status(304, headers)
+
+        size = st.st_size
+        start, end = 0, size - 1
+        code = 200
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header and (not if_range or if_range == etag):
+            try:
+                rng = _parse_range(range_header, size)
+            except ValueError:
+                return self._status(416, {"Content-Range": f"bytes */{size}"})
+            if rng:
+                start, end = rng
+                code = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        headers["Content-Type"] = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        headers["Content-Length"] = str(end - start + 1 if size else 0)
+        if head or not size:
+            # No body to transfer, so no stream slot needed
+            self._send_headers(code, headers)
+            return
+
+        if not _streams.acquire(blocking=False):
+            return self._status(503, {"Retry-After": "1"})
+        try:
+            self._send_headers(code, headers)
+            with open(path, "rb") as f:
+                # os.sendfile under the hood: the kernel copies file pages straight to the socket
+                self.connection.sendfile(f, offset=start, count=end - start + 1)
+            # The store indexes paths under RESULT_DIR as configured, not resolved
+            STORE.touch(os.path.join(RESULT_DIR, os.path.relpath(path, _SERVED_ROOT)))
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # phone scrolled away or lost signal
+        finally:
+            _streams.release()
+
+    def _not_modified(self, etag: str, mtime: float) -> bool:
+        inm = self.headers.get("If-None-Match")
+        if inm is not None:
+            return etag in [t.strip() for t in inm.split(",")] or inm.strip() == "*"
+        ims = self.headers.get("If-Modified-Since")
+        if ims:
+            try:
+                return int(mtime) <= email.utils.parsedate_to_datetime(ims).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+def start() -> ThreadingHTTPServer:
+    """Start the result server in a daemon thread (once per process)."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((RESULT_SERVER_HOST, RESULT_SERVER_PORT), ResultHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="result-server", daemon=True).start()
+            print(f"Result server listening on {RESULT_SERVER_HOST}:{RESULT_SERVER_PORT} (QR base {base_url()})")
+        return _server
+
+
+if __name__ == "__main__":
+    start()
+    threading.Event().wait()
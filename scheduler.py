@@ -0,0 +1,252 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import metrics
+from cancel import CancelToken
+
+# Scheduling classes. Interactive classes share slots by weight; background
+# jobs only run on capacity the interactive classes leave idle.
+KIOSK = "kiosk"
+WEB = "web"
+BACKGROUND = "background"
+INTERACTIVE_WEIGHTS = {KIOSK: 4, WEB: 1}
+CLASSES = (KIOSK, WEB, BACKGROUND)
+
+
+class QuotaExceeded(Exception):
+    """A client already has as many active jobs as its class allows."""
+
+
+class _ClassQueue:
+    """Pending jobs of one class, round-robin across clients so one client can't starve the rest."""
+
+    def __init__(self):
+        self.clients: "OrderedDict[str, deque]" = OrderedDict()
+        self.size = 0
+        self.finish = 0.0  # virtual finish tag of the class's last dispatched job
+
+    def push(self, client: str, job_id: str) -> None:
+        self.clients.setdefault(client, deque()).append(job_id)
+        self.size += 1
+
+    def pop(self) -> str:
+        client, jobs = next(iter(self.clients.items()))
+        job_id = jobs.popleft()
+        del self.clients[client]
+        if jobs:
+            self.clients[client] = jobs  # back of the line
+        self.size -= 1
+        return job_id
+
+    def remove(self, client: str, job_id: str) -> None:
+        jobs = self.clients[client]
+        jobs.remove(job_id)
+        if not jobs:
+            del self.clients[client]
+        self.size -= 1
+
+    def order(self) -> List[str]:
+        """Jobs in the order pop() would return them."""
+        queues = [list(q) for q in self.clients.values()]
+        out = []
+        for i in range(max((len(q) for q in queues), default=0)):
+            out.extend(q[i] for q in queues if i < len(q))
+        return out
+
+
+class Scheduler:
+    """
+    Bounded worker-slot pool for pipeline jobs, with scheduling classes.
+
+    At most `max_running` jobs hold a slot at once. Waiting kiosk and web jobs
+    share freed slots by weighted fair queuing (virtual finish times over
+    INTERACTIVE_WEIGHTS), round-robin across clients within a class.
+    Background jobs only start when no interactive job is waiting, and never
+    take the last `reserved` slots, so a guest at a kiosk doesn't wait behind
+    a bulk batch. Per-class quotas cap active (waiting + running) jobs per client.
+
+    Each running job gets its own daemon thread. Cancelling a job frees its slot
+    right away and hands it to the next waiting job, even if the cancelled
+    thread is still unwinding out of a blocking call.
+    """
+
+    def __init__(
+        self,
+        max_running: int,
+        reserved: int = 1,
+        quotas: Optional[Dict[str, int]] = None,
+        service_time_s: float = 120.0,
+    ):
+        self.max_running = max(1, max_running)
+        self.reserved = min(max(0, reserved), self.max_running - 1)
+        self.quotas = quotas or {}
+        self._lock = threading.Lock()
+        self._queues = {cls: _ClassQueue() for cls in CLASSES}
+        self._running: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._active: Dict[Tuple[str, str], int] = {}  # (class, client) -> waiting + running jobs
+        # Moving average of slot hold time, for wait estimates
+        self._service_time = service_time_s
+        self._order_cache: Optional[Dict[str, int]] = None
+        self._vtime = 0.0  # WFQ virtual time: finish tag of the last dispatched interactive job
+
+    def submit(self, job_id: str, fn: Callable[[], None], token: CancelToken, cls: str = WEB, client: str = "") -> None:
+        self.submit_many([(job_id, fn, token)], cls=cls, client=client)
+
+    def submit_many(
+        self,
+        entries: List[Tuple[str, Callable[[], None], CancelToken]],
+        cls: str = WEB,
+        client: str = "",
+    ) -> None:
+        """
+        Enqueue several jobs of one class and client under one lock acquisition,
+        preserving their order. Raises QuotaExceeded without enqueuing any of them
+        if they would take the client over its class quota.
+        """
+        if cls not in self._queues:
+            raise ValueError(f"unknown scheduling class: {cls}")
+        now = time.time()
+        with self._lock:
+            self._check_quota_locked(cls, client, len(entries))
+            queue = self._queues[cls]
+            if queue.size == 0 and cls in INTERACTIVE_WEIGHTS:
+                # Idle -> backlogged: restart from the current virtual time
+                # instead of cashing in turns banked while idle
+                queue.finish = max(queue.finish, self._vtime)
+            for job_id, fn, token in entries:
+                self._tasks[job_id] = {"fn": fn, "token": token, "enqueued_at": now, "class": cls, "client": client}
+                queue.push(client, job_id)
+            self._active[(cls, client)] = self._active.get((cls, client), 0) + len(entries)
+            metrics.JOBS_IN_FLIGHT.inc(len(entries), stage="queued")
+            self._order_cache = None
+            self._dispatch_locked()
+
+    def check_quota(self, cls: str, client: str, count: int = 1) -> None:
+        """Raise QuotaExceeded if `count` more jobs would exceed the client's quota."""
+        with self._lock:
+            self._check_quota_locked(cls, client, count)
+
+    def cancel(self, job_id: str, reason: str = "cancelled") -> Optional[str]:
+        """
+        Cancel a job and free its slot. Returns the state the job was in
+        ("pending" or "running"), or None if the scheduler no longer tracks it.
+        """
+        with self._lock:
+            task = self._tasks.pop(job_id, None)
+            if task is None:
+                return None
+            task["token"].cancel(reason)
+            self._release_client_locked(task["class"], task["client"])
+            if job_id in self._running:
+                del self._running[job_id]
+                self._dispatch_locked()
+                return "running"
+            self._queues[task["class"]].remove(task["client"], job_id)
+            self._order_cache = None
+            metrics.JOBS_IN_FLIGHT.dec(stage="queued")
+            return "pending"
+
+    def estimate(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Scheduling class and estimated seconds until the job gets a slot (0 once running)."""
+        with self._lock:
+            task = self._tasks.get(job_id)
+            if task is None:
+                return None
+            if job_id in self._running:
+                return {"class": task["class"], "position": 0, "estimated_wait_s": 0}
+            if self._order_cache is None:
+                self._order_cache = {jid: i for i, jid in enumerate(self._dispatch_order_locked())}
+            position = self._order_cache.get(job_id, 0)
+            # Slots free up at roughly max_running per service time
+            wait = (position + 1) * self._service_time / self.max_running
+            return {"class": task["class"], "position": position + 1, "estimated_wait_s": round(wait, 1)}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": sum(q.size for q in self._queues.values()),
+                "pending_by_class": {cls: q.size for cls, q in self._queues.items()},
+                "running": len(self._running),
+                "running_by_class": {
+                    cls: sum(1 for t in self._running.values() if t["class"] == cls) for cls in CLASSES
+                },
+                "slots": self.max_running,
+                "reserved_interactive": self.reserved,
+                "service_time_s": round(self._service_time, 1),
+            }
+
+    def _check_quota_locked(self, cls: str, client: str, count: int) -> None:
+        quota = self.quotas.get(cls, 0)
+        if quota and client and self._active.get((cls, client), 0) + count > quota:
+            raise QuotaExceeded(f"at most {quota} active {cls} jobs per client")
+
+    def _release_client_locked(self, cls: str, client: str) -> None:
+        key = (cls, client)
+        left = self._active.get(key, 0) - 1
+        if left > 0:
+            self._active[key] = left
+        else:
+            self._active.pop(key, None)
+
+    @staticmethod
+    def _finish_tag(finish: float, cls: str) -> float:
+        # Finish tag of a backlogged class's next job; the class's tag only
+        # jumps to the virtual time when it becomes backlogged (see submit_many)
+        return finish + 1.0 / INTERACTIVE_WEIGHTS[cls]
+
+    def _next_class_locked(self, running_background: int) -> Optional[str]:
+        waiting = [c for c in INTERACTIVE_WEIGHTS if self._queues[c].size]
+        if waiting:
+            return min(waiting, key=lambda c: self._finish_tag(self._queues[c].finish, c))
+        if self._queues[BACKGROUND].size and running_background < self.max_running - self.reserved:
+            return BACKGROUND
+        return None
+
+    def _dispatch_order_locked(self) -> List[str]:
+        """Simulate dispatch (ignoring future arrivals) to rank every waiting job."""
+        orders = {cls: deque(q.order()) for cls, q in self._queues.items()}
+        finish = {cls: self._queues[cls].finish for cls in INTERACTIVE_WEIGHTS}
+        out = []
+        while any(orders[c] for c in INTERACTIVE_WEIGHTS):
+            tags = {c: self._finish_tag(finish[c], c) for c in INTERACTIVE_WEIGHTS if orders[c]}
+            cls = min(tags, key=tags.get)
+            out.append(orders[cls].popleft())
+            finish[cls] = tags[cls]
+        return out + list(orders[BACKGROUND])
+
+    def _dispatch_locked(self) -> None:
+        running_background = sum(1 for t in self._running.values() if t["class"] == BACKGROUND)
+        while len(self._running) < self.max_running:
+            cls = self._next_class_locked(running_background)
+            if cls is None:
+                break
+            queue = self._queues[cls]
+            job_id = queue.pop()
+            if cls in INTERACTIVE_WEIGHTS:
+                queue.finish = self._vtime = self._finish_tag(queue.finish, cls)
+            else:
+                running_background += 1
+            self._order_cache = None
+            task = self._tasks[job_id]
+            task["started_at"] = time.time()
+            self._running[job_id] = task
+            metrics.JOBS_IN_FLIGHT.dec(stage="queued")
+            metrics.QUEUE_WAIT_SECONDS.observe(task["started_at"] - task["enqueued_at"], **{"class": cls})
+            t = threading.Thread(target=self._run, args=(job_id, task), daemon=True)
+            t.start()
+
+    def _run(self, job_id: str, task: Dict[str, Any]) -> None:
+        try:
+            task["fn"]()
+        finally:
+            with self._lock:
+                # A cancelled job already gave up its slot; only release once.
+                if self._running.get(job_id) is task:
+                    del self._running[job_id]
+                    self._tasks.pop(job_id, None)
+                    self._release_client_locked(task["class"], task["client"])
+                    self._service_time = 0.8 * self._service_time + 0.2 * (time.time() - task["started_at"])
+                    self._dispatch_locked()
@@ -0,0 +1,229 @@
+"""
+Local result storage for the Gradio deployment.
+
+Outputs live under RESULT_DIR/<kind>/<shard>/<digest><ext>, where digest is an
+HMAC-SHA256 of the caller's key (the phone number) and shard its first two hex
+digits, so no directory grows unbounded and user input never becomes a path.
+The HMAC secret keeps the result server's URLs from being computed by anyone
+who merely knows (or enumerates) a phone number.
+Writes go to a temp file in the same directory and are renamed into place, and
+a disk budget evicts the least recently written/served outputs. Quiz records
+use the same layout but are outside the budget.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+RESULT_DIR = os.path.abspath(os.getenv("RESULT_DIR", "result"))
+# Disk budget for stored outputs (videos, images, posters); 0 disables eviction
+RESULT_DISK_BUDGET_MB = int(os.getenv("RESULT_DISK_BUDGET_MB", "20480"))
+# Secret for the path HMAC; when unset, one is generated once and kept in RESULT_DIR/.store_key
+RESULT_KEY_SECRET = os.getenv("RESULT_KEY_SECRET", "")
+
+# Output kinds managed (and evictable) by the store
+KINDS = ("videos", "images", "posters")
+# Records stored the same way but never evicted or served (quiz results hold personal data)
+RECORD_KINDS = ("quiz",)
+TMP_SUFFIX = ".tmp"
+
+
+_secret: Optional[bytes] = None
+_secret_lock = threading.Lock()
+
+
+def _load_secret() -> bytes:
+    global _secret
+    with _secret_lock:
+        if _secret is None:
+            if RESULT_KEY_SECRET:
+                _secret = RESULT_KEY_SECRET.encode("utf-8")
+            else:
+                _secret = _stored_secret(os.path.join(RESULT_DIR, ".store_key"))
+        return _secret
+
+
+def _stored_secret(path: str) -> bytes:
+    # Same secret across restarts, so a returning phone number maps to the same files
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    value = secrets.token_hex(32).encode("ascii")
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, "rb") as f:  # another process got there first
+            return f.read()
+    with os.fdopen(fd, "wb") as f:
+        f.write(value)
+    return value
+
+
+def _digest(key: str) -> str:
+    return hmac.new(_load_secret(), str(key).encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def _fsync_dir(path: str) -> None:
+    # Make the rename itself durable; not supported on every platform
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def sweep_orphans(directory: str, before: Optional[float] = None) -> int:
+    """
+    Delete regular files in `directory` last modified before `before` (default:
+    now). Used at startup for uploads left behind by a crash. Returns the count.
+    """
+    cutoff = time.time() if before is None else before
+    removed = 0
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    if removed:
+        print(f"🧹 Removed {removed} orphaned file(s) from {directory}")
+    return removed
+
+
+class ResultStore:
+    def __init__(self, root: str = RESULT_DIR, budget_bytes: int = RESULT_DISK_BUDGET_MB * 1024 * 1024):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        # path -> size, least recently used first; built lazily from disk
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._loaded = False
+
+    def path_for(self, kind: str, key: str, ext: str) -> str:
+        if kind not in KINDS and kind not in RECORD_KINDS:
+            raise ValueError(f"unknown result kind: {kind}")
+        digest = _digest(key)
+        return os.path.join(self.root, kind, digest[:2], digest + ext)
+
+    def write(self, kind: str, key: str, ext: str, data: bytes) -> str:
+        """Atomically store `data` for `key` and return its path."""
+        path = self.path_for(kind, key, ext)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}{TMP_SUFFIX}"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        _fsync_dir(directory)
+        if kind not in KINDS:
+            return path
+
+        with self._lock:
+            self._load_locked()
+            self._total -= self._lru.pop(path, 0)
+            self._lru[path] = len(data)
+            self._total += len(data)
+            evicted = self._evict_locked(keep=path)
+        for old in evicted:
+            self._remove(old)
+        return path
+
+    def touch(self, path: str) -> None:
+        """Mark `path` as recently used (e.g. just served to a phone)."""
+        with self._lock:
+            if path in self._lru:
+                self._lru.move_to_end(path)
+
+    def usage(self) -> int:
+        with self._lock:
+            self._load_locked()
+            return self._total
+
+    def sweep(self) -> int:
+        """Remove temp files left by interrupted writes. Returns the count."""
+        removed = 0
+        for kind in KINDS + RECORD_KINDS:
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, kind)):
+                for name in filenames:
+                    if name.endswith(TMP_SUFFIX):
+                        try:
+                            os.remove(os.path.join(dirpath, name))
+                            removed += 1
+                        except OSError:
+                            pass
+        if removed:
+            print(f"🧹 Removed {removed} partial result file(s) from {self.root}")
+        return removed
+
+    def _load_locked(self) -> None:
+        # Index existing outputs once, oldest first, so restarts keep the LRU order roughly intact
+        if self._loaded:
+            return
+        found = []
+        for kind in KINDS:
+            for dirpath, _, filenames in os.walk(os.path.join(self.root, kind)):
+                for name in filenames:
+                    if name.endswith(TMP_SUFFIX):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((st.st_mtime, path, st.st_size))
+        for _, path, size in sorted(found):
+            self._lru[path] = size
+            self._total += size
+        self._loaded = True
+
+    def _evict_locked(self, keep: str):
+        evicted = []
+        if self.budget_bytes <= 0:
+            return evicted
+        while self._total > self.budget_bytes and len(self._lru) > 1:
+            path, size = next(iter(self._lru.items()))
+            if path == keep:
+                self._lru.move_to_end(path)
+                continue
+            del self._lru[path]
+            self._total -= size
+            evicted.append(path)
+        return evicted
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+            print(f"🗑️ Evicted {path} (disk budget {self.budget_bytes // (1024 * 1024)} MB)")
+        except OSError:
+            pass
+
+
+STORE = ResultStore()
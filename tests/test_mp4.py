@@ -0,0 +1,90 @@
+import struct
+
+from mp4 import faststart, needs_faststart, _boxes
+
+
+def box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def moov_with_offsets(offsets, kind=b"stco") -> bytes:
+    fmt = ">I" if kind == b"stco" else ">Q"
+    table = struct.pack(">II", 0, len(offsets)) + b"".join(struct.pack(fmt, o) for o in offsets)
+    stbl = box(b"stbl", box(kind, table))
+    return box(b"moov", box(b"trak", box(b"mdia", box(b"minf", stbl))))
+
+
+def chunk_offsets(data: bytes):
+    """Chunk offsets from the (single) stco/co64 table of `data`."""
+    def walk(start, end):
+        for kind, _, body, box_end in _boxes(data, start, end):
+            if kind in (b"moov", b"trak", b"mdia", b"minf", b"stbl"):
+                found = walk(body, box_end)
+                if found is not None:
+                    return found
+            elif kind in (b"stco", b"co64"):
+                count = struct.unpack_from(">I", data, body + 4)[0]
+                fmt, width = (">I", 4) if kind == b"stco" else (">Q", 8)
+                return [struct.unpack_from(fmt, data, body + 8 + i * width)[0] for i in range(count)]
+        return None
+    return walk(0, len(data))
+
+
+def build(layout, kind=b"stco"):
+    """
+    Assemble ftyp + the boxes in `layout` ("mdat:<chunk bytes>" or "moov"),
+    with moov's table pointing at the start of every chunk.
+    """
+    ftyp = box(b"ftyp", b"isom\x00\x00\x02\x00")
+    chunks = [part for part in layout if part != "moov"]
+    # moov's size doesn't depend on the offset values, so measure it first
+    moov_size = len(moov_with_offsets([0] * len(chunks), kind))
+    offsets, pos = [], len(ftyp)
+    for part in layout:
+        if part == "moov":
+            pos += moov_size
+        else:
+            offsets.append(pos + 8)
+            pos += 8 + len(part)
+    out = [ftyp]
+    for part in layout:
+        out.append(moov_with_offsets(offsets, kind) if part == "moov" else box(b"mdat", part))
+    return b"".join(out), chunks
+
+
+def assert_offsets_point_at_chunks(data, chunks):
+    for offset, chunk in zip(chunk_offsets(data), chunks):
+        assert data[offset:offset + len(chunk)] == chunk
+
+
+def test_moov_after_single_mdat_moves_to_front():
+    data, chunks = build([b"A" * 0xab, "moov"])
+    assert needs_faststart(data)
+    out = faststart(data)
+    assert len(out) == len(data)
+    assert [k for k, *_ in _boxes(out, 0, len(out))] == [b"ftyp", b"moov", b"mdat"]
+    assert_offsets_point_at_chunks(out, chunks)
+
+
+def test_mdat_after_moov_keeps_its_offsets():
+    data, chunks = build([b"A" * 0xab, "moov", b"B" * 0x40])
+    out = faststart(data)
+    assert [k for k, *_ in _boxes(out, 0, len(out))] == [b"ftyp", b"moov", b"mdat", b"mdat"]
+    assert_offsets_point_at_chunks(out, chunks)
+
+
+def test_co64_offsets_are_shifted():
+    data, chunks = build([b"A" * 100, b"C" * 50, "moov"], kind=b"co64")
+    out = faststart(data)
+    assert_offsets_point_at_chunks(out, chunks)
+
+
+def test_already_faststart_is_unchanged():
+    data, _ = build(["moov", b"A" * 100])
+    assert not needs_faststart(data)
+    assert faststart(data) is data
+
+
+def test_unparseable_input_is_unchanged():
+    data = b"\x00\x00\x00\x20ftypisom"  # box claims more bytes than exist
+    assert faststart(data) is data
@@ -0,0 +1,24 @@
+import pytest
+
+from result_server import _parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=50-", (50, 99)),
+    ("bytes=50-500", (50, 99)),
+    ("bytes=-5", (95, 99)),
+    ("bytes=10-5", None),      # last before first: invalid, serve the whole file
+    ("bytes=200-150", None),
+    ("bytes=0-1,5-6", None),   # multiple ranges aren't supported
+    ("bytes=a-b", None),
+    ("items=0-9", None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-300", "bytes=-0"])
+def test_unsatisfiable_range_raises(header):
+    with pytest.raises(ValueError):
+        _parse_range(header, 100)
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from cancel import CancelToken
+from scheduler import Scheduler, QuotaExceeded, KIOSK, WEB, BACKGROUND
+
+
+class Recorder:
+    """Jobs that log their id when they run; the first job holds the only slot until released."""
+
+    def __init__(self):
+        self.order = []
+        self.gate = threading.Event()
+        self.done = threading.Condition()
+
+    def job(self, job_id):
+        def fn():
+            with self.done:
+                self.order.append(job_id)
+                self.done.notify_all()
+        return fn
+
+    def blocker(self):
+        return self.gate.wait
+
+    def wait_for(self, count, timeout=5):
+        with self.done:
+            assert self.done.wait_for(lambda: len(self.order) >= count, timeout)
+
+
+def submit(sched, rec, job_id, cls, client):
+    sched.submit(job_id, rec.job(job_id), CancelToken(), cls=cls, client=client)
+
+
+def test_kiosk_and_web_interleave_four_to_one():
+    sched, rec = Scheduler(1, reserved=0), Recorder()
+    sched.submit("hold", rec.blocker(), CancelToken(), cls=KIOSK, client="x")
+    for i in range(20):
+        submit(sched, rec, f"k{i}", KIOSK, "kiosk")
+    for i in range(5):
+        submit(sched, rec, f"w{i}", WEB, "web")
+
+    # Every fifth slot goes to web while both classes are backlogged
+    assert sched.estimate("w0")["position"] == 5
+    assert sched.estimate("w1")["position"] == 10
+
+    rec.gate.set()
+    rec.wait_for(25)
+    assert rec.order[:10] == ["k0", "k1", "k2", "k3", "w0", "k4", "k5", "k6", "k7", "w1"]
+    assert rec.order[-5:] == ["k16", "k17", "k18", "k19", "w4"]
+
+
+def test_web_alone_is_not_held_back():
+    sched, rec = Scheduler(1, reserved=0), Recorder()
+    sched.submit("hold", rec.blocker(), CancelToken(), cls=WEB, client="x")
+    for i in range(3):
+        submit(sched, rec, f"w{i}", WEB, "web")
+    assert [sched.estimate(f"w{i}")["position"] for i in range(3)] == [1, 2, 3]
+    rec.gate.set()
+    rec.wait_for(3)
+
+
+def test_clients_take_turns_within_a_class():
+    sched, rec = Scheduler(1, reserved=0), Recorder()
+    sched.submit("hold", rec.blocker(), CancelToken(), cls=WEB, client="x")
+    for i in range(3):
+        submit(sched, rec, f"a{i}", WEB, "a")
+    for i in range(2):
+        submit(sched, rec, f"b{i}", WEB, "b")
+    rec.gate.set()
+    rec.wait_for(5)
+    assert rec.order == ["a0", "b0", "a1", "b1", "a2"]
+
+
+def test_background_waits_for_interactive_and_reserved_slots():
+    sched, rec = Scheduler(2, reserved=1), Recorder()
+    sched.submit("hold", rec.blocker(), CancelToken(), cls=BACKGROUND, client="bulk")
+    submit(sched, rec, "bg", BACKGROUND, "bulk")
+    # One slot is free, but it is reserved for interactive work
+    assert sched.stats()["running_by_class"][BACKGROUND] == 1
+    submit(sched, rec, "w", WEB, "web")
+    rec.wait_for(1)
+    assert rec.order == ["w"]
+    rec.gate.set()
+    rec.wait_for(2)
+    assert rec.order == ["w", "bg"]
+
+
+def test_quota_is_per_class():
+    gate = threading.Event()
+    sched = Scheduler(1, reserved=0, quotas={WEB: 2})
+    sched.submit_many([(f"b{i}", gate.wait, CancelToken()) for i in range(5)], cls=BACKGROUND, client="ip:1")
+    sched.check_quota(WEB, "ip:1")
+    for i in range(2):
+        sched.submit(f"w{i}", gate.wait, CancelToken(), cls=WEB, client="ip:1")
+    with pytest.raises(QuotaExceeded):
+        sched.check_quota(WEB, "ip:1")
+    sched.cancel("w1")
+    sched.check_quota(WEB, "ip:1")
+    gate.set()
@@ -0,0 +1,21 @@
+import os
+
+import storage
+
+
+def test_path_is_keyed_not_plain_sha256(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_secret", b"one")
+    store = storage.ResultStore(root=str(tmp_path), budget_bytes=0)
+    path = store.path_for("videos", "0501234567", ".mp4")
+    assert "0501234567" not in path
+    assert storage.hashlib.sha256(b"0501234567").hexdigest() not in path
+
+    monkeypatch.setattr(storage, "_secret", b"two")
+    assert store.path_for("videos", "0501234567", ".mp4") != path
+
+
+def test_stored_secret_is_created_once(tmp_path):
+    key_file = str(tmp_path / "key")
+    first = storage._stored_secret(key_file)
+    assert storage._stored_secret(key_file) == first
+    assert os.stat(key_file).st_mode & 0o777 == 0o600
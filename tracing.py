@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional
+
+# How many job traces to keep in memory, and how many spans each may hold
+TRACE_BUFFER_JOBS = int(os.getenv("TRACE_BUFFER_JOBS", "500"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "64"))
+# Optional JSONL file that receives every finished trace
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+
+_TRACES: "OrderedDict[str, Trace]" = OrderedDict()
+_LOCK = threading.Lock()
+_EXPORT_LOCK = threading.Lock()
+_current: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+
+
+class Span:
+    """One timed step of a job. Extra attributes (bytes, polls, request_id...) go in `attrs`."""
+
+    __slots__ = ("name", "start", "end", "attrs")
+
+    def __init__(self, name: str, start: float, attrs: Dict[str, Any]):
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.attrs = attrs
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        d = {
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "offset_s": round(self.start - origin, 3),
+            "duration_s": round(self.end - self.start, 3) if self.end is not None else None,
+        }
+        d.update(self.attrs)
+        return d
+
+
+class _NullSpan:
+    """Stand-in used when no trace is bound, so instrumentation costs next to nothing."""
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.created_at = time.time()
+        self.status: Optional[str] = None
+        self.spans = []
+        self.dropped = 0
+
+    def add(self, span: Span) -> None:
+        with _LOCK:
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+    def record(self, name: str, start: float, end: float, **attrs: Any) -> None:
+        """Add an already-finished span, e.g. queue wait measured after the fact."""
+        span = Span(name, start, attrs)
+        span.end = end
+        self.add(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with _LOCK:
+            spans = [s.to_dict(self.created_at) for s in self.spans]
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "spans": spans,
+            "dropped_spans": self.dropped,
+        }
+
+
+def begin(job_id: str) -> Trace:
+    """Create the trace for a new job, evicting the oldest trace when the buffer is full."""
+    trace = Trace(job_id)
+    with _LOCK:
+        _TRACES[job_id] = trace
+        while len(_TRACES) > TRACE_BUFFER_JOBS:
+            _TRACES.popitem(last=False)
+    return trace
+
+
+def discard(job_id: str) -> None:
+    """Drop a trace without exporting it, e.g. for a job that was rejected after all."""
+    with _LOCK:
+        _TRACES.pop(job_id, None)
+
+
+def get(job_id: str) -> Optional[Trace]:
+    with _LOCK:
+        return _TRACES.get(job_id)
+
+
+def bind(job_id: str) -> Optional[Trace]:
+    """
+    Make the job's trace current for the calling context. Each pipeline job runs
+    in its own thread (and therefore its own context), so no reset is needed.
+    """
+    trace = get(job_id)
+    _current.set(trace)
+    return trace
+
+
+@contextmanager
+def span(name: str, **attrs: Any):
+    """Time the enclosed block as a span of the current job's trace, if any."""
+    trace = _current.get()
+    if trace is None:
+        yield _NULL_SPAN
+        return
+    sp = Span(name, time.time(), attrs)
+    trace.add(sp)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.set(error=type(e).__name__)
+        raise
+    finally:
+        sp.end = time.time()
+
+
+def record(name: str, start: float, end: float, **attrs: Any) -> None:
+    """Add an already-finished span to the current job's trace, if any."""
+    trace = _current.get()
+    if trace is not None:
+        trace.record(name, start, end, **attrs)
+
+
+def finish(job_id: str, status: str) -> None:
+    """Mark a trace finished and append it to TRACE_FILE when export is enabled."""
+    trace = get(job_id)
+    if trace is None:
+        return
+    trace.status = status
+    if not TRACE_FILE:
+        return
+    line = json.dumps(trace.to_dict(), ensure_ascii=False)
+    try:
+        with _EXPORT_LOCK, open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"Trace export failed: {e}")
@@ -1,20 +1,27 @@
 import os
 import requests
-import json
 import time
+import threading
 import base64
 import mimetypes
+from functools import lru_cache
 from dotenv import load_dotenv
-from PIL import Image
 from io import BytesIO
-import qrcode
-from data_info import *
+from cancel import CancelToken, JobCancelled
+import metrics
+import tracing
+from mp4 import faststart
+from storage import STORE
+import profiles
+from profiles import PayloadTemplate, SLOT
 
 load_dotenv()
 API_KEY = os.getenv("WSAI_KEY")
-# Create result folder if it doesn't exist
-os.makedirs("result/videos", exist_ok=True)
-os.makedirs("result/images", exist_ok=True)
+# Overridable so load tests can point at a local stand-in (loadtest/fake_wavespeed.py)
+WAVESPEED_BASE_URL = os.getenv("WAVESPEED_BASE_URL", "https://api.wavespeed.ai/api/v3").rstrip("/")
+# Poll responses worth retrying (rate limiting and transient server errors); polls are idempotent
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+SUBMIT_ATTEMPTS = 3
 
 def compress_image(image_path, max_size_kb=900, quality=85):
     """
@@ -39,6 +46,10 @@ def compress_image(image_path, max_size_kb=900, quality=85):
             return None
 
         print(f"Image size: {current_size_kb:.1f}KB - compressing to {max_size_kb}KB...")
+        from PIL import Image  # lazy: keeps PIL off the import path of the API
+
+        begin = time.perf_counter()
+        started_at = time.time()
 
         img = Image.open(image_path)
 
@@ -74,6 +85,11 @@ def compress_image(image_path, max_size_kb=900, quality=85):
             current_quality -= 5
 
         output.seek(0)
+        metrics.COMPRESSION_SECONDS.observe(time.perf_counter() - begin)
+        tracing.record(
+            "compress", started_at, time.time(),
+            bytes_in=int(current_size_kb * 1024), bytes_out=output.getbuffer().nbytes, quality=current_quality,
+        )
         print(f"✓ Compressed: {current_size_kb:.1f}KB → {size_kb:.1f}KB (quality: {current_quality})")
         return output
 
@@ -118,216 +134,352 @@ def file_to_base64(file_path, compress=False, max_size_kb=900):
     return f"data:{mime_type};base64,{encoded_string}"
 
 
-# CHANGED: Renamed from qwen_edit to nano_banana_edit
-def nano_banana_edit(img1, age_gap):
+def asset_to_base64(file_path, compress=False, max_size_kb=900):
     """
-    Edit image using Google Nano Banana Pro API.
-    Places user in UAE-themed scene with traditional attire.
+    Cached file_to_base64 for static assets (background, dresses, audio).
+    Each asset is encoded once per process and shared by every job, including
+    all jobs of a batch; changing the file on disk invalidates its entry.
     """
-    # 1. Convert User Uploaded Image (img1) to Base64 WITH COMPRESSION
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        print(f"Error: File not found at {file_path}")
+        return None
+    return _cached_base64(file_path, st.st_mtime_ns, st.st_size, compress, max_size_kb)
+
+
+@lru_cache(maxsize=32)
+def _cached_base64(file_path, mtime_ns, size, compress, max_size_kb):
+    return file_to_base64(file_path, compress=compress, max_size_kb=max_size_kb)
+
+
+# Pre-serialized request bodies per (profile version, stage); only the per-job slot changes
+_PAYLOAD_TEMPLATES = {}
+_TEMPLATES_LOCK = threading.Lock()
+
+
+def _payload_template(profile, stage):
+    """Build (once per profile version) the request template for `stage` ("image" or "video"), or None."""
+    key = (profile.version, stage)
+    with _TEMPLATES_LOCK:
+        template = _PAYLOAD_TEMPLATES.get(key)
+    if template is not None:
+        return template
+
+    if stage == "image":
+        # Background and dress, compressed and base64-encoded (cached across jobs)
+        bg_b64 = asset_to_base64(profile.background, compress=True, max_size_kb=900)
+        dress_b64 = asset_to_base64(profile.dress, compress=True, max_size_kb=900)
+        if not bg_b64 or not dress_b64:
+            print("Failed to encode background or dress images. Check file paths in 'data' folder.")
+            return None
+        payload = {**profile.image_params, "images": [SLOT, bg_b64, dress_b64], "prompt": profile.image_prompt}
+    else:
+        audio_b64 = asset_to_base64(profile.audio)
+        if not audio_b64:
+            print(f"Failed to encode audio file: {profile.audio}")
+            return None
+        payload = {"audio": audio_b64, "image": SLOT, "prompt": profile.video_prompt, **profile.video_params}
+
+    template = PayloadTemplate(payload)
+    with _TEMPLATES_LOCK:
+        _PAYLOAD_TEMPLATES[key] = template
+    return template
+
+
+def _nano_banana_payload(img1, age_gap):
+    """Serialized Nano Banana Pro request body for one user image, or None if an asset fails to encode."""
+    profile = profiles.resolve(age_gap)
+    # User image to base64 WITH COMPRESSION; it is the only per-job part of the payload
     img1_b64 = file_to_base64(img1, compress=True, max_size_kb=900)
     if not img1_b64:
         print("Failed to encode input image")
         return None
 
-    # 2. Define Local Paths
-    img2_path = bg_path
-
-    # Costume Image selection
-    if age_gap == "Male":
-        img3_path = img3_m
-        prompt = prompt_m
-    elif age_gap == "Female":
-        img3_path = img3_f
-        prompt = prompt_f
-    elif age_gap == "Boy":
-        img3_path = img3_b
-        prompt = prompt_b
-    else:
-        img3_path = img3_g
-        prompt = prompt_g
+    template = _payload_template(profile, "image")
+    if template is None:
+        return None
+    return template.render(img1_b64)
 
-    # 3. Convert Local Assets to Base64 WITH COMPRESSION
-    img2_b64 = file_to_base64(img2_path, compress=True, max_size_kb=900)
-    img3_b64 = file_to_base64(img3_path, compress=True, max_size_kb=900)
 
-    if not img2_b64 or not img3_b64:
-        print("Failed to encode background or dress images. Check file paths in 'data' folder.")
+# CHANGED: Renamed from qwen_edit to nano_banana_edit
+def nano_banana_edit(img1, age_gap, token=None):
+    """
+    Edit image using Google Nano Banana Pro API.
+    Places user in UAE-themed scene with traditional attire.
+
+    `token` is an optional CancelToken; cancelling it (or passing its deadline)
+    stops polling, cancels the provider prediction and raises JobCancelled.
+    """
+    token = token or CancelToken()
+    try:
+        profile = profiles.resolve(age_gap)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return None
+    body = _nano_banana_payload(img1, profile)
+    if body is None:
         return None
 
-    # CHANGED: API endpoint from Qwen to Nano Banana Pro
-    url = "https://api.wavespeed.ai/api/v3/google/nano-banana-pro/edit"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}",
-    }
-    # CHANGED: Payload structure for Nano Banana Pro
-    payload = {
-        "aspect_ratio": "9:16",              # NEW: vertical format
-        "enable_base64_output": False,
-        "enable_sync_mode": False,
-        "images": [img1_b64, img2_b64, img3_b64],
-        # REMOVED: "loras" field (Qwen-specific)
-        "output_format": "jpeg",
-        "prompt": prompt,
-        "resolution": "1k",                   # CHANGED: from "size": "756*1024"
-        # REMOVED: "seed" field
-    }
+    url = f"{WAVESPEED_BASE_URL}/{profile.image_endpoint}"
 
     begin = time.time()
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
-    if response.status_code == 200:
-        result = response.json()["data"]
-        request_id = result["id"]
-        print(f"✅ Nano Banana task submitted. Request ID: {request_id}")
-    else:
-        print(f"❌ Error: {response.status_code}, {response.text}")
+    request_id = _submit_prediction(url, body, token, stage="image")
+    if not request_id:
         return None
+    print(f"✅ Nano Banana task submitted. Request ID: {request_id}")
 
-    # Poll for results
-    url = f"https://api.wavespeed.ai/api/v3/predictions/{request_id}/result"
-    headers = {"Authorization": f"Bearer {API_KEY}"}
-
-    max_retries = 360
-    retry_count = 0
-    while retry_count < max_retries:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            result = response.json()["data"]
-            status = result["status"]
-            if status == "completed":
-                end = time.time()
-                print(f"✅ Image edit completed in {end - begin:.1f} seconds.")
-                return result["outputs"][0]  # Returns a URL
-            elif status == "failed":
-                print(f"❌ Task failed: {result.get('error')}")
-                return None
-            else:
-                print(f"⏳ Task processing... Status: {status}")
-        else:
-            print(f"❌ Error: {response.status_code}, {response.text}")
-            return None
-        time.sleep(0.1)
-        retry_count += 1
-    
-    print("❌ Task timed out after maximum retries")
-    return None
+    output = _poll_prediction(request_id, token, max_retries=360, interval=0.1, stage="image", label="Task")
+    if output:
+        elapsed = time.time() - begin
+        metrics.IMAGE_EDIT_SECONDS.observe(elapsed)
+        print(f"✅ Image edit completed in {elapsed:.1f} seconds.")
+    return output
 
 
-def wans2v(img, age_gap):
+def wans2v(img, age_gap, token=None):
     """
     Generate video from edited image using WAN 2.2 speech-to-video.
+    Honours `token` the same way as nano_banana_edit.
     """
-    # Note: 'img' here is already a URL (output from nano_banana_edit)
-
-    # Select audio and prompt
-    if age_gap == "Male":
-        audio_path = audio_m
-        prompt = prompt_mw
-    elif age_gap == "Female":
-        audio_path = audio_f
-        prompt = prompt_fw
-    elif age_gap == "Boy":
-        audio_path = audio_b
-        prompt = prompt_bw
-    else:
-        audio_path = audio_g
-        prompt = prompt_gw
+    token = token or CancelToken()
+    try:
+        profile = profiles.resolve(age_gap)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return None
+
+    # Audio, prompt and model params are pre-serialized per profile;
+    # 'img' (a URL from nano_banana_edit) is the only per-job part
+    template = _payload_template(profile, "video")
+    if template is None:
+        return None
+    body = template.render(img)
+    url = f"{WAVESPEED_BASE_URL}/{profile.video_endpoint}"
 
-    # Convert local audio file to Base64
-    audio_b64 = file_to_base64(audio_path)
-    if not audio_b64:
-        print(f"Failed to encode audio file: {audio_path}")
+    begin = time.time()
+    request_id = _submit_prediction(url, body, token, stage="video")
+    if not request_id:
         return None
+    print(f"✅ Video task submitted. Request ID: {request_id}")
+
+    output = _poll_prediction(request_id, token, max_retries=240, interval=0.5, stage="video", label="Video")
+    if output:
+        elapsed = time.time() - begin
+        metrics.VIDEO_SECONDS.observe(elapsed)
+        print(f"✅ Video generation completed in {elapsed:.1f} seconds.")
+    return output
+
+
+def _retry_delay(response, attempt):
+    """Honour Retry-After when the provider sends one, else back off exponentially."""
+    try:
+        return min(float(response.headers.get("Retry-After", "")), 30.0)
+    except ValueError:
+        return min(2 ** attempt, 30)
+
 
-    url = "https://api.wavespeed.ai/api/v3/wavespeed-ai/wan-2.2/speech-to-video"
+def _submit_retryable(response):
+    if response.status_code == 429:
+        return True
+    return response.status_code == 503 and "Retry-After" in response.headers
+
+
+def _submit_prediction(url, body, token, stage):
+    """
+    Submit a prediction (`body` is the serialized JSON request). Returns the
+    provider request ID, or None.
+
+    Only responses that mean the job was not accepted are retried: 429, and 503
+    with Retry-After. Other 5xx can arrive after the provider already created
+    the prediction, so retrying them could start a duplicate, billed generation.
+    """
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {API_KEY}",
     }
-    payload = {
-        "audio": audio_b64,  # Base64 encoded audio
-        "image": img,        # URL from previous step
-        "prompt": prompt,
-        "resolution": "480p",
-        "seed": -1
-    }
+    with tracing.span("submit", stage=stage, bytes=len(body)) as sp:
+        for attempt in range(SUBMIT_ATTEMPTS):
+            token.check()
+            sp.set(attempts=attempt + 1)
+            with metrics.SUBMIT_SECONDS.time(stage=stage):
+                response = requests.post(url, headers=headers, data=body, timeout=token.timeout(60))
+            if response.status_code == 200:
+                request_id = response.json()["data"]["id"]
+                sp.set(request_id=request_id)
+                return request_id
+            if _submit_retryable(response) and attempt + 1 < SUBMIT_ATTEMPTS:
+                metrics.RETRIES_TOTAL.inc(stage=stage)
+                print(f"⚠️ Submit returned {response.status_code}, retrying...")
+                token.sleep(_retry_delay(response, attempt))
+                continue
+            sp.set(http_status=response.status_code)
+            print(f"❌ Error: {response.status_code}, {response.text}")
+            return None
 
-    begin = time.time()
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
-    if response.status_code == 200:
-        result = response.json()["data"]
-        request_id = result["id"]
-        print(f"✅ Video task submitted. Request ID: {request_id}")
-    else:
-        print(f"❌ Error: {response.status_code}, {response.text}")
-        return None
 
-    # Poll for results
-    url = f"https://api.wavespeed.ai/api/v3/predictions/{request_id}/result"
+def _poll_prediction(request_id, token, max_retries, interval, stage, label):
+    """
+    Poll a WaveSpeed prediction until it completes, fails or runs out of retries.
+    Returns the first output URL, or None. If the job is cancelled mid-poll the
+    provider prediction is cancelled too and JobCancelled propagates.
+    Rate-limited or transient poll errors are retried within `max_retries`.
+    """
+    url = f"{WAVESPEED_BASE_URL}/predictions/{request_id}/result"
     headers = {"Authorization": f"Bearer {API_KEY}"}
 
-    max_retries = 240
     retry_count = 0
-    while retry_count < max_retries:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            result = response.json()["data"]
-            status = result["status"]
-            if status == "completed":
-                end = time.time()
-                print(f"✅ Video generation completed in {end - begin:.1f} seconds.")
-                return result["outputs"][0]
-            elif status == "failed":
-                print(f"❌ Task failed: {result.get('error')}")
-                return None
+    polls = 0
+    transient = 0
+    started_at = time.time()
+    outcome = "timeout"
+    try:
+        while retry_count < max_retries:
+            response = requests.get(url, headers=headers, timeout=token.timeout(30))
+            polls += 1
+            metrics.POLLS_TOTAL.inc(stage=stage)
+            if response.status_code in TRANSIENT_STATUS:
+                metrics.RETRIES_TOTAL.inc(stage=stage)
+                transient += 1
+                retry_count += 1
+                token.sleep(max(interval, _retry_delay(response, 0)))
+                continue
+            if response.status_code == 200:
+                result = response.json()["data"]
+                status = result["status"]
+                if status == "completed":
+                    outcome = "completed"
+                    return result["outputs"][0]  # Returns a URL
+                elif status == "failed":
+                    outcome = "failed"
+                    print(f"❌ {label} failed: {result.get('error')}")
+                    return None
+                else:
+                    print(f"⏳ {label} processing... Status: {status}")
             else:
-                print(f"⏳ Video processing... Status: {status}")
-        else:
-            return None
-        time.sleep(0.5)
-        retry_count += 1
-    
-    print("❌ Video generation timed out")
+                outcome = f"http_{response.status_code}"
+                print(f"❌ Error: {response.status_code}, {response.text}")
+                return None
+            token.sleep(interval)
+            retry_count += 1
+    except JobCancelled:
+        outcome = "cancelled"
+        _cancel_prediction(request_id)
+        raise
+    finally:
+        metrics.POLLS_PER_PREDICTION.observe(polls, stage=stage)
+        tracing.record(
+            "poll", started_at, time.time(),
+            stage=stage, request_id=request_id, polls=polls, retries=transient, outcome=outcome,
+        )
+
+    print(f"❌ {label} timed out after maximum retries")
     return None
 
 
-def save_video(url, id):
+def _cancel_prediction(request_id):
+    """Best-effort cancel of a running prediction so it stops consuming provider capacity."""
+    url = f"{WAVESPEED_BASE_URL}/predictions/{request_id}/cancel"
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    try:
+        response = requests.post(url, headers=headers, timeout=5)
+        print(f"🛑 Cancel requested for {request_id}: {response.status_code}")
+    except requests.RequestException as e:
+        print(f"Cancel request for {request_id} failed: {e}")
+
+
+def download_bytes(url, token=None, timeout=60, chunk_size=256 * 1024, kind="output"):
+    """
+    Download a URL into memory, checking `token` between chunks so a cancelled
+    job stops transferring immediately. Returns (data, content_type).
+    Raises requests.HTTPError on a non-2xx response.
+    """
+    token = token or CancelToken()
+    with tracing.span("download", kind=kind) as sp, metrics.DOWNLOAD_SECONDS.time(kind=kind):
+        with requests.get(url, stream=True, timeout=token.timeout(timeout)) as response:
+            response.raise_for_status()
+            buf = BytesIO()
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                token.check()
+                buf.write(chunk)
+            sp.set(bytes=buf.tell())
+            return buf.getvalue(), response.headers.get("Content-Type")
+
+
+def save_video(url, id, token=None):
     """Download and save video from URL."""
     if url is None:
         print("Error: No URL provided")
         return None
-    response = requests.get(url)
-    if response.status_code == 200:
-        file_path = f"result/videos/{id}.mp4"
-        with open(file_path, "wb") as f:
-            f.write(response.content)
-        print(f"✅ Video saved: {file_path}")
-        return file_path
-    else:
-        print(f"❌ Error downloading video: {response.status_code}")
+    try:
+        data, _ = download_bytes(url, token=token, timeout=300, kind="video")
+    except requests.HTTPError as e:
+        print(f"❌ Error downloading video: {e.response.status_code}")
         return None
+    data = faststart(data)
+    file_path = STORE.write("videos", id, ".mp4", data)
+    print(f"✅ Video saved: {file_path}")
+    return file_path
 
 
-def save_photo(url, id):
+def save_photo(url, id, token=None):
     """Download and save edited image from URL."""
     if url is None:
         print("Error: No URL provided")
         return None
-    response = requests.get(url)
-    if response.status_code == 200:
-        file_path = f"result/images/{id}.jpeg"
-        with open(file_path, "wb") as f:
-            f.write(response.content)
-        print(f"✅ Image saved: {file_path}")
-        return file_path
-    else:
-        print(f"❌ Error downloading image: {response.status_code}")
+    try:
+        data, _ = download_bytes(url, token=token, timeout=60, kind="image")
+    except requests.HTTPError as e:
+        print(f"❌ Error downloading image: {e.response.status_code}")
+        return None
+    file_path = STORE.write("images", id, ".jpeg", data)
+    print(f"✅ Image saved: {file_path}")
+    return file_path
+
+
+def make_poster(image_bytes, max_side=480, quality=75):
+    """
+    Small JPEG poster for the result page, derived from the edited image (the
+    video's first frame is that image animated). Returns JPEG bytes.
+    """
+    from PIL import Image
+
+    with tracing.span("poster", bytes_in=len(image_bytes)) as sp:
+        img = Image.open(BytesIO(image_bytes))
+        img.draft("RGB", (max_side, max_side))  # JPEG: decode at reduced scale
+        img = img.convert("RGB")
+        img.thumbnail((max_side, max_side))
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+        sp.set(bytes_out=buf.tell())
+        return buf.getvalue()
+
+
+def save_poster(image_path, id):
+    """Write a poster JPEG next to the saved results."""
+    try:
+        with open(image_path, "rb") as f:
+            data = make_poster(f.read())
+    except Exception as e:
+        print(f"❌ Error creating poster: {e}")
         return None
+    file_path = STORE.write("posters", id, ".jpg", data)
+    print(f"✅ Poster saved: {file_path}")
+    return file_path
 
 
 def generate_qr_code(video_path):
-    """Generate QR code for video download."""
+    """
+    Generate QR code for video download. A local file path is encoded as its
+    URL on the result server (result_server.py), since phones can't open paths.
+    """
+    import qrcode
+    from PIL import Image
+
+    if not video_path.startswith(("http://", "https://")):
+        from result_server import result_url
+        video_path = result_url(video_path)
+
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,